@@ -8,7 +8,7 @@ a = Analysis(
     pathex=[],
     binaries=[('ffmpeg', '.'), ('venv/lib/python3.10/site-packages/torch/lib/libomp.dylib', '.')] + qwen_binaries,
     datas=[('static', 'static')] + qwen_datas,
-    hiddenimports=['main', 'huggingface_hub', 'huggingface_hub.utils', 'uvicorn', 'uvicorn.logging', 'uvicorn.loops.auto', 'uvicorn.loops.asyncio', 'uvicorn.protocols.http.auto', 'uvicorn.protocols.websockets.auto', 'starlette.background'] + qwen_hiddenimports,
+    hiddenimports=['main', 'huggingface_hub', 'huggingface_hub.utils', 'uvicorn', 'uvicorn.logging', 'uvicorn.loops.auto', 'uvicorn.loops.asyncio', 'uvicorn.protocols.http.auto', 'uvicorn.protocols.websockets.auto', 'starlette.background', 'psutil'] + qwen_hiddenimports,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
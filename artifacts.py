@@ -0,0 +1,211 @@
+"""
+Server-held audio artifacts.
+
+Generated, merged and treated audio is kept on disk under an opaque id so the browser can
+play it with HTTP Range requests and export by id instead of uploading Blobs back. Each
+artifact is a WAV file plus a small JSON sidecar; keeping the metadata on disk (rather than
+in process memory) lets every server instance that shares TTS_DATA_DIR serve any artifact.
+
+Artifacts are temporary: they expire ARTIFACT_TTL seconds after last use and the oldest are
+removed first whenever the directory grows past ARTIFACT_MAX_BYTES.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import soundfile as sf
+
+ARTIFACT_TTL = float(os.environ.get("TTS_ARTIFACT_TTL", 6 * 3600))
+ARTIFACT_MAX_BYTES = int(os.environ.get("TTS_ARTIFACT_MAX_BYTES", 2 * 1024 ** 3))
+CLEANUP_INTERVAL = 60.0  # Minimum seconds between directory sweeps
+# Files this long untouched without a readable sidecar are leftovers of a crash, not in-flight writes
+ORPHAN_GRACE = 15 * 60.0
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_lock = threading.Lock()
+_state = {"dir": None, "last_cleanup": 0.0}
+
+def init(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    _state["dir"] = directory
+
+def _paths(artifact_id: str):
+    if not _ID_RE.match(artifact_id or ""):
+        return None, None
+    base = os.path.join(_state["dir"], artifact_id)
+    return base + ".wav", base + ".json"
+
+def _write_meta(meta_path: str, meta: dict):
+    # Write-then-rename so a sweep in another instance never reads a half-written sidecar
+    tmp = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+def new_path():
+    """Reserve an id and the WAV path to write it to; call register() once the file exists."""
+    artifact_id = uuid.uuid4().hex
+    return artifact_id, _paths(artifact_id)[0]
+
+def register(artifact_id: str, kind: str, extra: dict = None) -> dict:
+    """Write the sidecar for a WAV already at the artifact's path and return its metadata."""
+    wav_path, meta_path = _paths(artifact_id)
+    info = sf.info(wav_path)
+    now = time.time()
+    meta = {
+        "id": artifact_id,
+        "kind": kind,
+        "size": os.path.getsize(wav_path),
+        "duration": info.duration,
+        "sample_rate": info.samplerate,
+        "channels": info.channels,
+        "etag": f'"{artifact_id}"',  # Artifacts are immutable, so the id is a strong validator
+        "created": now,
+        "accessed": now,
+    }
+    if extra:
+        meta.update(extra)
+    _write_meta(meta_path, meta)
+    maybe_cleanup()
+    return meta
+
+def store_bytes(data: bytes, kind: str, extra: dict = None) -> dict:
+    artifact_id, path = new_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    return register(artifact_id, kind, extra)
+
+def store_file(src_path: str, kind: str, extra: dict = None) -> dict:
+    """Move an existing WAV file into the store."""
+    artifact_id, path = new_path()
+    shutil.move(src_path, path)
+    os.utime(path)  # A move keeps the source's mtime; the sweep must not see it as an old orphan
+    return register(artifact_id, kind, extra)
+
+def get(artifact_id: str):
+    """Metadata (with "path") for a live artifact, or None. Refreshes its TTL."""
+    wav_path, meta_path = _paths(artifact_id)
+    if not wav_path or not os.path.exists(meta_path) or not os.path.exists(wav_path):
+        return None
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    now = time.time()
+    if now - meta["accessed"] > ARTIFACT_TTL:
+        delete(artifact_id)
+        return None
+    # Only rewrite the sidecar occasionally; playback issues many Range requests
+    if now - meta["accessed"] > CLEANUP_INTERVAL:
+        meta["accessed"] = now
+        _write_meta(meta_path, meta)
+    meta["path"] = wav_path
+    return meta
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def delete(artifact_id: str):
+    for path in _paths(artifact_id):
+        if path and os.path.exists(path):
+            _remove(path)
+
+def maybe_cleanup(force: bool = False):
+    now = time.time()
+    if not force and now - _state["last_cleanup"] < CLEANUP_INTERVAL:
+        return
+    if not _lock.acquire(blocking=False):
+        return
+    try:
+        _state["last_cleanup"] = now
+        directory = _state["dir"]
+        names = set(os.listdir(directory))
+        entries = []
+        pending = 0  # Bytes of WAVs still being written (no sidecar yet)
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                if age > ORPHAN_GRACE:
+                    _remove(path)
+                continue
+            if name.endswith(".wav") and name[:-4] + ".json" not in names:
+                if age > ORPHAN_GRACE:
+                    _remove(path)  # Left behind by a crash before register()
+                else:
+                    pending += os.path.getsize(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            artifact_id = name[:-5]
+            try:
+                with open(path, "r") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                # Unreadable: skip it unless it has been that way too long to be a write in progress
+                if age > ORPHAN_GRACE:
+                    delete(artifact_id)
+                continue
+            if now - meta.get("accessed", 0) > ARTIFACT_TTL:
+                delete(artifact_id)
+            else:
+                entries.append((meta.get("accessed", 0), artifact_id, meta.get("size", 0)))
+
+        # Over budget: drop least recently used first
+        total = pending + sum(e[2] for e in entries)
+        for _, artifact_id, size in sorted(entries):
+            if total <= ARTIFACT_MAX_BYTES:
+                break
+            delete(artifact_id)
+            total -= size
+    finally:
+        _lock.release()
+
+def parse_range(header: str, size: int):
+    """Parse a single-range "bytes=" header into (start, end) inclusive.
+
+    Returns None when there is no usable Range header (serve the whole file) and raises
+    ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    spec = header[len("bytes="):].strip()
+    start_s, _, end_s = spec.partition("-")
+    try:
+        if start_s == "":
+            # Suffix range: the last N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError("empty suffix range")
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+    except ValueError:
+        raise ValueError(f"Malformed range: {header}")
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = 256 * 1024):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
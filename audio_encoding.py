@@ -0,0 +1,110 @@
+"""
+WAV encoding for model output.
+
+encode_wav() converts float samples to the requested sample format and writes the RIFF header
+and the sample data into one preallocated bytearray: the data section is filled through a
+numpy view of that buffer, CHUNK_SAMPLES at a time, so the only temporaries are fixed-size
+scratch and dither arrays. The result can be handed to a Response (as a memoryview) or
+written to disk as-is, and its length is known up front for Content-Length.
+
+PCM output is dithered with high-pass TPDF noise (the difference of consecutive uniform
+draws: triangular amplitude distribution, one draw per sample instead of two). The draws are
+single bytes of the generator's raw output, so the noise is quantized to 1/256 LSB, far below
+the LSB it dithers. float32 is written unchanged.
+"""
+import struct
+
+import numpy as np
+
+# name -> (bytes per sample, WAVE format tag, full-scale value)
+FORMATS = {
+    "pcm16": (2, 1, 32767.0),
+    "pcm24": (3, 1, 8388607.0),
+    "float32": (4, 3, None),
+}
+DEFAULT_FORMAT = "pcm16"
+HEADER_BYTES = 44
+CHUNK_SAMPLES = 4096  # Samples converted per pass through the scratch buffers
+DITHER_STEP = np.float32(1 / 256)
+
+def resample(audio, sr: int, target_sr: int):
+    """Band-limited resampling by truncating or zero-padding the spectrum (whole signal)."""
+    x = np.asarray(audio, dtype=np.float32)
+    if target_sr == sr or not len(x):
+        return x
+    n_out = int(round(len(x) * target_sr / sr))
+    spectrum = np.fft.rfft(x, axis=0)
+    bins = n_out // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+    else:
+        pad = [(0, bins - len(spectrum))] + [(0, 0)] * (x.ndim - 1)
+        spectrum = np.pad(spectrum, pad)
+    return (np.fft.irfft(spectrum, n_out, axis=0) * (n_out / len(x))).astype(np.float32)
+
+def encode_wav(audio, sr: int, sample_format: str = DEFAULT_FORMAT, dither: bool = True,
+               rng: np.random.Generator = None) -> bytearray:
+    """Encode float audio, shape (frames,) or (frames, channels), as a WAV file in one buffer."""
+    width, format_tag, full_scale = FORMATS[sample_format]
+    x = np.asarray(audio)
+    channels = 1 if x.ndim == 1 else x.shape[1]
+    count = x.size
+    data_bytes = count * width
+
+    buf = bytearray(HEADER_BYTES + data_bytes)
+    struct.pack_into(
+        "<4sI4s4sIHHIIHH4sI", buf, 0,
+        b"RIFF", HEADER_BYTES - 8 + data_bytes, b"WAVE",
+        b"fmt ", 16, format_tag, channels, sr, sr * channels * width, channels * width, width * 8,
+        b"data", data_bytes,
+    )
+    if not count:
+        return buf
+    flat = x.reshape(-1)
+
+    if full_scale is None:
+        np.copyto(np.frombuffer(buf, dtype="<f4", offset=HEADER_BYTES), flat, casting="same_kind")
+        return buf
+
+    if width == 2:
+        out = np.frombuffer(buf, dtype="<i2", offset=HEADER_BYTES)
+    else:
+        out = np.frombuffer(buf, dtype=np.uint8, offset=HEADER_BYTES).reshape(-1, 3)
+
+    # Fixed-size scratch: temporaries stay small however long the audio is
+    size = min(CHUNK_SAMPLES, count)
+    scratch = np.empty(size, dtype=np.float32)
+    ints = np.empty(size, dtype="<i4") if width == 3 else None
+    scale = np.float32(full_scale)
+    # Clipping is one of the slower passes; skip it when no sample (plus 1 LSB of dither) can overflow
+    needs_clip = max(-float(flat.min()), float(flat.max())) * full_scale + 1 >= full_scale
+    if dither:
+        # Noise comes from the generator's raw output, 8 one-byte draws per 64-bit word, which
+        # is several times cheaper than float draws; the bytes are in 1/256 LSB, so the
+        # signal is scaled up by 256 while the noise is added and back down afterwards.
+        bits = (rng or np.random.default_rng()).bit_generator
+        scale = np.float32(full_scale * 256)
+        last = bits.random_raw() & 0xFF
+
+    for start in range(0, count, size):
+        n = min(size, count - start)
+        s = scratch[:n]
+        np.multiply(flat[start:start + n], scale, out=s, casting="same_kind")
+        if dither:
+            draws = bits.random_raw(n // 8 + 1).view(np.uint8)
+            # Carry the last draw over so the noise is continuous across chunks
+            draws[0] = last
+            last = draws[n]
+            s += draws[1:n + 1]
+            s -= draws[:n]
+            s *= DITHER_STEP
+        np.rint(s, out=s)
+        if needs_clip:
+            np.clip(s, -full_scale - 1, full_scale, out=s)
+        if width == 2:
+            np.copyto(out[start:start + n], s, casting="unsafe")
+        else:
+            # No 24-bit dtype: keep the low three bytes of each little-endian int32
+            np.copyto(ints[:n], s, casting="unsafe")
+            out[start:start + n] = ints[:n].view(np.uint8).reshape(-1, 4)[:, :3]
+    return buf
@@ -0,0 +1,47 @@
+"""
+Compare the WAV encode stage of /api/generate: the old sf.write-into-BytesIO path against
+audio_encoding.encode_wav. Reports wall time per call and peak Python allocation.
+
+    python bench_encoding.py [seconds_of_audio]
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+import audio_encoding
+
+SR = 24000
+
+def sf_write(audio):
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, SR, format="WAV")
+    return buffer.getvalue()
+
+def measure(name, func, audio, runs=20):
+    func(audio)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        out = func(audio)
+    elapsed = (time.perf_counter() - start) / runs
+
+    tracemalloc.start()
+    func(audio)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Beyond the output buffer itself, which every path has to allocate
+    print(f"{name:<28} {elapsed * 1000:8.2f} ms   peak alloc {peak / 1e6:7.2f} MB "
+          f"(+{(peak - len(out)) / 1e3:6.1f} KB)   {len(out) / 1e6:6.2f} MB out")
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    audio = (np.random.default_rng(0).standard_normal(int(SR * seconds)) * 0.1).astype(np.float32)
+    print(f"{seconds:.0f}s of mono float32 audio at {SR}Hz")
+    measure("sf.write -> BytesIO", sf_write, audio)
+    measure("encode_wav pcm16", lambda a: audio_encoding.encode_wav(a, SR, "pcm16"), audio)
+    measure("encode_wav pcm16 (no dither)", lambda a: audio_encoding.encode_wav(a, SR, "pcm16", dither=False), audio)
+    measure("encode_wav pcm24", lambda a: audio_encoding.encode_wav(a, SR, "pcm24"), audio)
+    measure("encode_wav float32", lambda a: audio_encoding.encode_wav(a, SR, "float32"), audio)
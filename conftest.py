@@ -0,0 +1,3 @@
+# The test_main_fix.py, test_tts.py and test_ui.py scripts drive a real model or browser and
+# are run by hand; pytest only collects the unit tests.
+collect_ignore = ["test_main_fix.py", "test_tts.py", "test_ui.py"]
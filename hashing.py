@@ -0,0 +1,19 @@
+"""
+Chunked file hashing shared by the updater, the model store and generation.
+
+Files are read CHUNK_SIZE bytes at a time, so hashing a multi-GB model file or a long upload
+never holds it in memory.
+"""
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+def update_from_file(h, path: str):
+    """Feed the contents of path into the hash object h and return h."""
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h
+
+def sha256_file(path: str) -> str:
+    return update_from_file(hashlib.sha256(), path).hexdigest()
@@ -0,0 +1,337 @@
+"""
+Loudness normalization from per-segment measurements.
+
+Every generated segment is measured once, at generation time, following EBU R128 / ITU-R
+BS.1770: the K-weighted signal is cut into 400ms blocks (100ms hop) and the blocks above the
+-70 LUFS absolute gate are kept as a histogram of 0.1 LU bins holding a block count and an
+energy sum per bin. Summing histograms is exact, so the integrated loudness of a whole
+document (relative gate included, to within one bin) follows from its segments' stats
+without reading any audio. True peak is measured on a 4x oversampled signal.
+
+The export treatments EQ the audio before normalizing it, so each segment is measured once
+per treatment curve. Measuring runs on every generation, so it streams over the segment in
+ANALYSIS_BLOCK-sample blocks and its memory does not grow with segment length: each biquad
+is an exact IIR filter applied block by block (FFT convolution with its impulse response
+plus the response to the state carried over from the previous block), and true peak uses a
+polyphase 4x interpolator, as in BS.1770 Annex 2. Nothing beyond numpy is needed.
+
+Merge turns the combined stats into a static gain towards TARGET_LUFS, plus a peak limiter
+when the gained true peak would pass TARGET_TRUE_PEAK. This replaces loudnorm's own full
+analysis pass; being a static gain there is no loudness-range (LRA) compression.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+
+TARGET_LUFS = -16.0
+TARGET_TRUE_PEAK = -1.5
+# The limiter works on sample peaks; leave room for inter-sample overshoot
+TRUE_PEAK_MARGIN_DB = 0.5
+
+BLOCK_SECONDS = 0.4
+HOP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+BIN_LU = 0.1
+OVERSAMPLE = 4
+INTERPOLATOR_TAPS = 16  # Per phase of the true-peak interpolator
+ANALYSIS_BLOCK = 1 << 14  # Samples per streamed block
+
+# EQ applied by each /api/treat treatment ahead of loudnorm, as (shelf, frequency, gain dB).
+# These mirror ffmpeg's bass/treble filters (RBJ shelves, Q=0.5) in main.TREATMENT_EQ_FILTERS.
+TREATMENT_EQ = {
+    "podcast": None,
+    "warmth": ("low", 200.0, 6.0),
+    "clear": ("high", 2000.0, 7.0),
+}
+
+def _shelf(kind: str, freq: float, gain_db: float, q: float, sr: int):
+    """RBJ cookbook shelving biquad as (b, a)."""
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * freq / sr
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    sq = 2 * math.sqrt(A) * alpha
+    if kind == "low":
+        b = (A * ((A + 1) - (A - 1) * cos_w0 + sq), 2 * A * ((A - 1) - (A + 1) * cos_w0),
+             A * ((A + 1) - (A - 1) * cos_w0 - sq))
+        a = ((A + 1) + (A - 1) * cos_w0 + sq, -2 * ((A - 1) + (A + 1) * cos_w0),
+             (A + 1) + (A - 1) * cos_w0 - sq)
+    else:
+        b = (A * ((A + 1) + (A - 1) * cos_w0 + sq), -2 * A * ((A - 1) + (A + 1) * cos_w0),
+             A * ((A + 1) + (A - 1) * cos_w0 - sq))
+        a = ((A + 1) - (A - 1) * cos_w0 + sq, 2 * ((A - 1) - (A + 1) * cos_w0),
+             (A + 1) - (A - 1) * cos_w0 - sq)
+    return b, a
+
+def _k_weighting(sr: int):
+    """BS.1770 pre-filter (high shelf) and RLB high-pass, re-derived for any sample rate.
+
+    At 48kHz these reproduce the coefficients tabulated in the recommendation.
+    """
+    k = math.tan(math.pi * 1681.974450955533 / sr)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0), \
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    k = math.tan(math.pi * 38.13547087602444 / sr)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = (1.0, -2.0, 1.0), (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    return [shelf, highpass]
+
+class _Biquad:
+    """Biquad filter applied block by block with exactly the output of a sample-by-sample IIR.
+
+    Within a block, the output is the block convolved with the filter's impulse response (by
+    FFT) plus the all-pole response to the two input and output samples carried over from the
+    previous block.
+    """
+
+    def __init__(self, b, a, block: int = ANALYSIS_BLOCK):
+        a0 = a[0]
+        self.b = [c / a0 for c in b]
+        self.a = [c / a0 for c in a]
+        # All-pole impulse response from the poles: g[n] = (p1^(n+1) - p2^(n+1)) / (p1 - p2)
+        p1, p2 = np.roots([1.0, self.a[1], self.a[2]]).astype(np.complex128)
+        n = np.arange(block + 1)
+        if abs(p1 - p2) < 1e-12:
+            g = (n + 1) * p1 ** n
+        else:
+            g = (p1 ** (n + 1) - p2 ** (n + 1)) / (p1 - p2)
+        self.g = g.real
+        h = self.b[0] * self.g[:block]
+        h[1:] += self.b[1] * self.g[:block - 1]
+        h[2:] += self.b[2] * self.g[:block - 2]
+        self.n_fft = 2 * block
+        self.h_spectrum = np.fft.rfft(h, self.n_fft)
+        self.x1 = self.x2 = self.y1 = self.y2 = 0.0
+
+    def process(self, x, spectrum=None):
+        """Filter the next block; `spectrum` is rfft(x, 2 * block) if the caller already has it."""
+        n = len(x)
+        if not n:
+            return x
+        b0, b1, b2 = self.b
+        _, a1, a2 = self.a
+        if spectrum is None:
+            spectrum = np.fft.rfft(x, self.n_fft)
+        y = np.fft.irfft(spectrum * self.h_spectrum, self.n_fft)[:n]
+        y += (b1 * self.x1 + b2 * self.x2 - a1 * self.y1 - a2 * self.y2) * self.g[:n]
+        y[1:] += (b2 * self.x1 - a2 * self.y1) * self.g[:n - 1]
+        self.x2, self.x1 = (x[-2] if n > 1 else self.x1), x[-1]
+        self.y2, self.y1 = (y[-2] if n > 1 else self.y1), y[-1]
+        return y
+
+class _Cascade:
+    def __init__(self, biquads):
+        self.stages = [_Biquad(b, a) for b, a in biquads]
+
+    def process(self, x, spectrum=None):
+        for stage in self.stages:
+            x = stage.process(x, spectrum)
+            spectrum = None
+        return x
+
+def _interpolator():
+    """Polyphase windowed-sinc 4x interpolator as (OVERSAMPLE, INTERPOLATOR_TAPS) taps."""
+    size = OVERSAMPLE * INTERPOLATOR_TAPS
+    t = (np.arange(size) - size // 2) / OVERSAMPLE  # One phase lands on the input samples
+    proto = np.sinc(t) * np.kaiser(size, 8.0)
+    phases = proto.reshape(INTERPOLATOR_TAPS, OVERSAMPLE).T[:, ::-1]
+    return phases / phases.sum(axis=1, keepdims=True)
+
+class _TruePeak:
+    """Running maximum of the 4x oversampled absolute signal, fed block by block."""
+
+    def __init__(self):
+        self.phases = _interpolator()
+        self.history = np.zeros(INTERPOLATOR_TAPS - 1)
+        self.peak = 0.0
+
+    def process(self, x):
+        if not len(x):
+            return
+        ext = np.concatenate([self.history, x])
+        for taps in self.phases:
+            self.peak = max(self.peak, float(np.max(np.abs(np.convolve(ext, taps, mode="valid")))))
+        self.history = ext[-(INTERPOLATOR_TAPS - 1):]
+
+    def finish(self):
+        self.process(np.zeros(INTERPOLATOR_TAPS - 1))  # Flush the interpolator's tail
+        return self.peak
+
+class _HopEnergy:
+    """Sum of squares per 100ms hop, accumulated block by block."""
+
+    def __init__(self, hop: int):
+        self.hop = hop
+        self.rest = np.zeros(0)
+        self.energies = []
+
+    def process(self, x):
+        buf = np.concatenate([self.rest, x])
+        full = len(buf) // self.hop * self.hop
+        if full:
+            self.energies.extend(np.square(buf[:full]).reshape(-1, self.hop).sum(axis=1))
+        self.rest = buf[full:]
+
+    def finish(self):
+        if len(self.rest):
+            self.energies.append(float(np.square(self.rest).sum()))
+        return np.asarray(self.energies, dtype=np.float64)
+
+def _eq_biquads(treatment: str, sr: int):
+    curve = TREATMENT_EQ[treatment]
+    if curve is None:
+        return []
+    kind, freq, gain_db = curve
+    return [_shelf(kind, freq, gain_db, 0.5, sr)]
+
+def _hop_samples(sr: int) -> int:
+    return int(round(HOP_SECONDS * sr))
+
+def _histogram(hop_energy, sr: int):
+    """Gating-block histogram from per-hop energies; a gating block is BLOCK_SECONDS of hops."""
+    hop = _hop_samples(sr)
+    per_block = int(round(BLOCK_SECONDS / HOP_SECONDS))
+    # Merges put silence around every segment, so blocks that overlap its edges count too
+    edge = np.zeros(per_block - 1)
+    hops = np.concatenate([edge, hop_energy, edge])
+    if len(hops) < per_block:
+        return []
+    sums = np.concatenate(([0.0], np.cumsum(hops)))
+    energy = (sums[per_block:] - sums[:-per_block]) / (per_block * hop)
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(energy)
+    keep = loudness >= ABSOLUTE_GATE
+    bins = np.floor((loudness[keep] - ABSOLUTE_GATE) / BIN_LU).astype(np.int64)
+    counts = np.bincount(bins)
+    sums = np.bincount(bins, weights=energy[keep])
+    return [[int(i), int(counts[i]), float(sums[i])] for i in np.nonzero(counts)[0]]
+
+def analyze(audio, sr: int):
+    """Gating histogram and true peak of a mono segment, per treatment EQ curve.
+
+    Returns {"sample_rate", "stats": {treatment: {"blocks": [[bin, count, energy_sum], ...],
+    "true_peak": dBTP or None}}}; JSON-serializable for the artifact sidecar.
+    """
+    x = np.asarray(audio).reshape(-1)
+    # The filters are linear, so K-weighting runs once and each EQ is applied after it
+    k_weighting = _Cascade(_k_weighting(sr))
+    chains = {}
+    for treatment in TREATMENT_EQ:
+        eq = _eq_biquads(treatment, sr)
+        chains[treatment] = {
+            "eq": _Cascade(eq),  # For the true peak of the EQ'd signal
+            "weighted_eq": _Cascade(eq),
+            "peak": _TruePeak(),
+            "energy": _HopEnergy(_hop_samples(sr)),
+        }
+
+    n_fft = 2 * ANALYSIS_BLOCK
+    for start in range(0, len(x), ANALYSIS_BLOCK):
+        block = x[start:start + ANALYSIS_BLOCK].astype(np.float64)
+        # Every filter that reads the same block shares its forward FFT
+        block_spectrum = np.fft.rfft(block, n_fft)
+        weighted = k_weighting.process(block, block_spectrum)
+        weighted_spectrum = np.fft.rfft(weighted, n_fft)
+        for chain in chains.values():
+            chain["peak"].process(chain["eq"].process(block, block_spectrum))
+            chain["energy"].process(chain["weighted_eq"].process(weighted, weighted_spectrum))
+
+    stats = {}
+    for treatment, chain in chains.items():
+        peak = chain["peak"].finish()
+        stats[treatment] = {
+            "blocks": _histogram(chain["energy"].finish(), sr),
+            "true_peak": 20 * math.log10(peak) if peak > 0 else None,
+        }
+    return {"sample_rate": sr, "stats": stats}
+
+def integrated_loudness(segment_stats):
+    """Integrated loudness (LUFS) of the concatenation of segments, or None if all silent."""
+    counts = defaultdict(int)
+    sums = defaultdict(float)
+    for stats in segment_stats:
+        for i, count, energy in stats["blocks"]:
+            counts[i] += count
+            sums[i] += energy
+    total = sum(counts.values())
+    if not total:
+        return None
+    ungated = sum(sums.values()) / total
+    threshold = -0.691 + 10 * math.log10(ungated) + RELATIVE_GATE
+    # A bin is in when its centre clears the relative gate
+    kept = [i for i in counts if ABSOLUTE_GATE + (i + 0.5) * BIN_LU >= threshold]
+    return -0.691 + 10 * math.log10(sum(sums[i] for i in kept) / sum(counts[i] for i in kept))
+
+def plan(segment_stats, target_lufs: float = TARGET_LUFS, target_true_peak: float = TARGET_TRUE_PEAK):
+    """Document gain and limiter setting from the segments' stats for one treatment."""
+    integrated = integrated_loudness(segment_stats)
+    peaks = [s["true_peak"] for s in segment_stats if s["true_peak"] is not None]
+    true_peak = max(peaks) if peaks else None
+    gain_db = target_lufs - integrated if integrated is not None else 0.0
+    limit_db = None
+    if true_peak is not None and true_peak + gain_db > target_true_peak:
+        limit_db = target_true_peak
+    return {"integrated": integrated, "true_peak": true_peak, "gain_db": gain_db,
+            "limit_db": limit_db, "target_lufs": target_lufs}
+
+class PeakLimiter:
+    """Streaming look-ahead peak limiter for blocks of shape (frames, channels).
+
+    Gain is decided per 5ms window: each window boundary takes the smaller of the gains its two
+    neighbouring windows need, gain ramps linearly between boundaries (so no sample inside a
+    window exceeds the limit), and it recovers with an exponential release. Output lags input
+    by up to two windows; call flush() at the end to get the remainder.
+    """
+
+    def __init__(self, limit_db: float, sr: int, window: float = 0.005, release: float = 0.1):
+        self.limit = 10 ** (limit_db / 20)
+        self.size = max(int(sr * window), 1)
+        self.decay = math.exp(-window / release)
+        self.buffer = None
+        self.prev_required = 1.0
+        self.gain = 1.0
+        self.ramp = np.arange(self.size, dtype=np.float32) / self.size
+
+    def process(self, block):
+        buf = block if self.buffer is None else np.concatenate([self.buffer, block])
+        windows = len(buf) // self.size
+        if windows < 2:
+            self.buffer = buf
+            return buf[:0]
+
+        frames = buf[:windows * self.size].reshape(windows, self.size, buf.shape[1])
+        peak = np.abs(frames).max(axis=(1, 2))
+        required = np.minimum(1.0, self.limit / np.maximum(peak, 1e-12))
+        points = np.minimum(np.concatenate(([self.prev_required], required[:-1])), required)
+
+        gains = np.empty(windows, dtype=np.float32)
+        g = self.gain
+        for k in range(windows):
+            g = min(points[k], 1.0 - (1.0 - g) * self.decay)
+            gains[k] = g
+
+        # The last window needs its successor's gain point, so it stays buffered
+        curve = gains[:-1, None] + (gains[1:] - gains[:-1])[:, None] * self.ramp[None, :]
+        out = (frames[:-1] * curve[:, :, None]).reshape(-1, buf.shape[1])
+        self.prev_required = required[-2]
+        self.gain = gains[-2]
+        self.buffer = buf[(windows - 1) * self.size:]
+        return out.astype(np.float32, copy=False)
+
+    def flush(self):
+        if self.buffer is None or not len(self.buffer):
+            return None
+        n = len(self.buffer)
+        padded = -(-n // self.size) * self.size + self.size
+        tail = np.zeros((padded - n, self.buffer.shape[1]), dtype=self.buffer.dtype)
+        out = self.process(tail)
+        self.buffer = None
+        return out[:n]
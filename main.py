@@ -1,10 +1,9 @@
 import os
 import sys
-import io
 import tempfile
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Request, Form, UploadFile, File
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Request, Form, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse, Response, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.background import BackgroundTask
 import uuid
@@ -14,14 +13,32 @@ import torch
 import asyncio
 import json
 import gc
+import time
 from pydub import AudioSegment
 from typing import List, Optional
-import requests
+from collections import deque
 import subprocess
+import artifacts
+import audio_encoding
+import hashing
+import uploads
+import profiling
+import model_store
+import loudness
+import prompt_cache
+import sentences
+import updater
 
 APP_VERSION = "1.0.2" # Current application version
 GITHUB_REPO = "parkerallen1/localTTSstudio" # Actual repo for OTA updates
 
+# psutil is optional; without it process RSS is read from /proc (Linux) or not at all
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
 # We attempt to import qwen_tts but catch the error if it fails during initial import
 try:
     from qwen_tts import Qwen3TTSModel
@@ -33,15 +50,30 @@ except Exception as _e:
     HAS_QWEN = False
 
 # Profile Storage Setup
-if getattr(sys, 'frozen', False):
+# TTS_DATA_DIR lets several server instances (see router.py) share one profile store.
+if os.environ.get("TTS_DATA_DIR"):
+    DATA_DIR = os.environ["TTS_DATA_DIR"]
+elif getattr(sys, 'frozen', False):
     DATA_DIR = os.path.expanduser("~/.qwen_tts_studio")
 else:
     DATA_DIR = "data"
 
+# Stub models synthesize a plain tone instead of loading Qwen weights, so routing and
+# multi-instance setups can be exercised on a box without the models downloaded.
+USE_STUB_MODEL = os.environ.get("TTS_STUB_MODEL", "") not in ("", "0")
+
 PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
 PROFILES_FILE = os.path.join(PROFILES_DIR, "profiles.json")
 os.makedirs(PROFILES_DIR, exist_ok=True)
 
+ARTIFACTS_DIR = os.path.join(DATA_DIR, "artifacts")
+artifacts.init(ARTIFACTS_DIR)
+TRACES_DIR = os.path.join(DATA_DIR, "traces")
+TRACE_KEEP = int(os.environ.get("TTS_TRACE_KEEP", 100))  # Newest traces kept on disk, 0 keeps all
+profiling.init(TRACES_DIR, keep=TRACE_KEEP)
+MODELS_DIR = os.path.join(DATA_DIR, "models")
+model_store.init(MODELS_DIR)
+
 if not os.path.exists(PROFILES_FILE):
     with open(PROFILES_FILE, "w") as f:
         json.dump([], f)
@@ -62,6 +94,9 @@ def load_profiles():
     # Always prepend the built-in profile
     return [BUILTIN_PROFILE] + user_profiles
 
+def find_profile(profile_id):
+    return next((p for p in load_profiles() if p["id"] == profile_id), None)
+
 def save_profiles(profiles):
     # Filter out the built-in profile before saving
     user_profiles = [p for p in profiles if p.get("id") != BUILTIN_PROFILE_ID]
@@ -73,6 +108,105 @@ model = None
 current_model_id = None
 model_lock = None
 
+# Number of /api/generate requests currently being served (reported by /api/health)
+active_generations = 0
+
+# Idle eviction and memory guard. A TTL or limit of 0 disables that check.
+MODEL_IDLE_TTL = float(os.environ.get("TTS_MODEL_IDLE_TTL", 30 * 60))  # Seconds without use before unloading
+MODEL_RSS_LIMIT_MB = float(os.environ.get("TTS_MODEL_RSS_LIMIT_MB", 0))  # Refuse new loads above this RSS
+MODEL_LOAD_WAIT = float(os.environ.get("TTS_MODEL_LOAD_WAIT", 30))  # Seconds a load waits for memory to free up
+REAPER_INTERVAL = 30.0
+model_last_used = 0.0
+model_events = deque(maxlen=50)  # Recent loads/evictions with memory readings, for /api/memory
+memory_samples = deque(maxlen=120)  # (timestamp, rss_bytes) taken by the reaper
+
+class MemoryPressureError(RuntimeError):
+    """Raised instead of loading a model while the process is above MODEL_RSS_LIMIT_MB."""
+
+class ModelBusyError(RuntimeError):
+    """Raised instead of swapping out a model that open editing sessions have pinned."""
+
+# Pins held by open /api/session connections: model_id -> number of sessions. A pinned model is
+# never unloaded by the idle reaper, and a swap to another model waits up to MODEL_LOAD_WAIT for
+# its pins to be released before failing with ModelBusyError.
+model_pins = {}
+
+def pin_model(model_id: str):
+    model_pins[model_id] = model_pins.get(model_id, 0) + 1
+
+def unpin_model(model_id: str):
+    if model_pins.get(model_id, 0) > 1:
+        model_pins[model_id] -= 1
+    else:
+        model_pins.pop(model_id, None)
+
+def current_rss_bytes():
+    """Resident set size of this process in bytes, or None if it cannot be read."""
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # getrusage only has peak RSS, which never drops after an unload; report nothing instead
+        return None
+
+def _mb(n):
+    return None if n is None else round(n / (1024 * 1024), 1)
+
+def _record_model_event(event: str, model_id: str, **extra):
+    entry = {"time": time.time(), "event": event, "model": model_id, "rss_mb": _mb(current_rss_bytes()), **extra}
+    model_events.append(entry)
+    print(f"[memory] {event} {model_id} rss={entry['rss_mb']}MB {extra if extra else ''}")
+
+def _unload_model(reason: str):
+    """Drop the loaded model and release allocator caches. Caller holds model_lock where it matters."""
+    global model, current_model_id
+    if model is None:
+        return
+    unloaded_id = current_model_id
+    del model
+    model = None
+    current_model_id = None
+    # Cached prompts are tensors on the model's device; let them go with it
+    prompt_cache.clear()
+    gc.collect()
+    if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
+        torch.mps.empty_cache()
+    elif torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    _record_model_event("unloaded", unloaded_id, reason=reason)
+
+def _expected_model_bytes(model_id: str) -> int:
+    """Rough resident size of a model once loaded: its snapshot on disk, or 0 if unknown."""
+    return model_store.disk_usage(model_id)
+
+def _over_memory_limit(incoming_bytes: int = 0):
+    """True when the current RSS plus incoming_bytes (a model about to load) passes the limit."""
+    if not MODEL_RSS_LIMIT_MB:
+        return False
+    rss = current_rss_bytes()
+    return rss is not None and rss + incoming_bytes > MODEL_RSS_LIMIT_MB * 1024 * 1024
+
+async def _model_reaper():
+    """Unload the model once it has sat idle for MODEL_IDLE_TTL seconds."""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        rss = current_rss_bytes()
+        memory_samples.append((time.time(), rss))
+        if _over_memory_limit():
+            print(f"[memory] rss={_mb(rss)}MB is above the {MODEL_RSS_LIMIT_MB}MB limit")
+
+        if not MODEL_IDLE_TTL or model is None or active_generations > 0 or current_model_id in model_pins:
+            continue
+        if time.time() - model_last_used < MODEL_IDLE_TTL:
+            continue
+        async with _get_model_lock():
+            # Re-check under the lock; a request may have picked the model up meanwhile
+            if (model is not None and active_generations == 0 and current_model_id not in model_pins
+                    and time.time() - model_last_used >= MODEL_IDLE_TTL):
+                _unload_model(f"idle for {int(time.time() - model_last_used)}s")
+
 # Global progress state
 download_progress = {
     "status": "idle", # idle, downloading, extracting, ready, error
@@ -98,60 +232,189 @@ hf_utils.tqdm = InterceptTqdm
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    reaper = asyncio.create_task(_model_reaper())
     yield
+    reaper.cancel()
     print("Shutting down... clearing models.")
-    global model, current_model_id
-    if model is not None:
-        del model
-        model = None
-        current_model_id = None
-        gc.collect()
-        if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-            torch.mps.empty_cache()
-        elif torch.cuda.is_available():
-            torch.cuda.empty_cache()
+    _unload_model("shutdown")
 
 VALID_MODEL_SIZES = {"0.6B", "1.7B"}
 VALID_MODEL_TYPES = {"Base", "CustomVoice", "VoiceDesign"}
 
+class StubTTSModel:
+    """Stand-in for Qwen3TTSModel that renders a short tone per request (TTS_STUB_MODEL=1)."""
+    sample_rate = 24000
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+
+    def _tone(self, text):
+        texts = text if isinstance(text, list) else [text]
+        wavs = []
+        for t in texts:
+            duration = min(0.05 * max(len(t), 1), 30.0)
+            n = np.arange(int(self.sample_rate * duration))
+            wavs.append((0.2 * np.sin(2 * np.pi * 220.0 * n / self.sample_rate)).astype(np.float32))
+        return wavs, self.sample_rate
+
+    def generate_custom_voice(self, text, **kwargs):
+        return self._tone(text)
+
+    def generate_voice_design(self, text, **kwargs):
+        return self._tone(text)
+
+    def generate_voice_clone(self, text, **kwargs):
+        return self._tone(text)
+
+    def create_voice_clone_prompt(self, ref_audio, ref_text=None, **kwargs):
+        return [{"ref_spk_embedding": np.zeros(1024, dtype=np.float32), "ref_text": ref_text}]
+
+# Sampling settings shared by every generation path
+GENERATION_KWARGS = {
+    "temperature": 0.3,
+    "repetition_penalty": 1.1,
+    "top_p": 0.8,
+    "subtalker_temperature": 0.3,
+}
+
+def synthesize_sync(tts_model, model_type: str, text, language: str, speaker: str = None,
+                    instruct: str = None, ref_audio: str = None, ref_text: str = None,
+                    voice_clone_prompt=None):
+    """Run the model call for `model_type`. `text` may be a list to synthesize a batch.
+
+    For Base models either `voice_clone_prompt` (precomputed) or `ref_audio`/`ref_text` is used.
+    """
+    if model_type == "CustomVoice":
+        return tts_model.generate_custom_voice(text=text, language=language, speaker=speaker, **GENERATION_KWARGS)
+    if model_type == "VoiceDesign":
+        return tts_model.generate_voice_design(text=text, language=language, instruct=instruct, **GENERATION_KWARGS)
+    if model_type == "Base":
+        if voice_clone_prompt is not None:
+            return tts_model.generate_voice_clone(text=text, language=language,
+                                                  voice_clone_prompt=voice_clone_prompt, **GENERATION_KWARGS)
+        return tts_model.generate_voice_clone(text=text, language=language, ref_audio=ref_audio,
+                                              ref_text=ref_text, **GENERATION_KWARGS)
+    raise ValueError(f"Unsupported model_type: {model_type}")
+
+def voice_fingerprint(model_id: str, model_type: str, language: str, speaker: str = None,
+                      instruct: str = None, voice_key: str = None, ref_text: str = None) -> str:
+    """Identity of a voice for reusing sentence audio; differs whenever the audio would."""
+    voice = {"model": model_id, "language": language, "sampling": GENERATION_KWARGS}
+    if model_type == "CustomVoice":
+        voice["speaker"] = speaker
+    elif model_type == "VoiceDesign":
+        voice["instruct"] = instruct
+    else:
+        voice.update(reference=voice_key, ref_text=ref_text)
+    return sentences.fingerprint(**voice)
+
+def voice_clone_prompt_for(tts_model, model_id: str, voice_key: str, ref_audio: str, ref_text: str):
+    """Voice-clone prompt for a reference clip, built once per model and voice (see prompt_cache).
+    None when the model cannot precompute prompts, in which case ref_audio/ref_text are used."""
+    if not hasattr(tts_model, "create_voice_clone_prompt"):
+        return None
+    return prompt_cache.get_or_create(
+        (model_id, voice_key, ref_text),
+        lambda: tts_model.create_voice_clone_prompt(ref_audio=ref_audio, ref_text=ref_text),
+    )
+
+def synthesize_paragraph_sync(tts_model, model_type: str, text: str, language: str,
+                              paragraph_id: str, fingerprint: str, fresh: bool = False, **voice):
+    """Synthesize a paragraph sentence by sentence, reusing the audio of every sentence that is
+    unchanged since the paragraph was last generated with this voice. fresh=True re-synthesizes
+    every sentence (a new take of an unedited paragraph) and replaces the cached audio.
+
+    Returns (audio, sample_rate, sentences_reused, sentence_count).
+    """
+    new_sentences = sentences.split_sentences(text)
+    cached = None if fresh else sentences.lookup(paragraph_id, fingerprint)
+    reuse = sentences.plan(cached["sentences"], new_sentences) if cached else [None] * len(new_sentences)
+    segments = [cached["segments"][i] if i is not None else None for i in reuse]
+    sr = cached["sr"] if cached else None
+
+    todo = [i for i, r in enumerate(reuse) if r is None]
+    if todo:
+        # One batched call for all changed sentences
+        wavs, sr = synthesize_sync(tts_model, model_type, [new_sentences[i] for i in todo], language, **voice)
+        for i, wav in zip(todo, wavs):
+            segments[i] = np.asarray(wav, dtype=np.float32)
+
+    sentences.remember(paragraph_id, fingerprint, new_sentences, segments, sr)
+    return sentences.splice(segments, sr), sr, len(new_sentences) - len(todo), len(new_sentences)
+
 def _load_model_sync(model_id: str, device: str, dtype: torch.dtype):
-    """Synchronous function to load the model."""
+    """Synchronous function to load the model, from a prefetched snapshot when there is one."""
+    if USE_STUB_MODEL:
+        return StubTTSModel(model_id)
     from qwen_tts import Qwen3TTSModel
-    m = Qwen3TTSModel.from_pretrained(model_id, device_map=device, dtype=dtype)
+    source = model_store.local_path(model_id) or model_id
+    m = Qwen3TTSModel.from_pretrained(source, device_map=device, dtype=dtype)
     return m
 
-async def get_tts_model(size: str = "1.7B", model_type: str = "CustomVoice"):
-    global model, current_model_id, model_lock
-    
+def _get_model_lock():
+    global model_lock
     if model_lock is None:
         model_lock = asyncio.Lock()
+    return model_lock
+
+async def get_tts_model(size: str = "1.7B", model_type: str = "CustomVoice"):
+    global model, current_model_id, model_last_used
     
     expected_model_id = f"Qwen/Qwen3-TTS-12Hz-{size}-{model_type}"
     
     if current_model_id == expected_model_id and model is not None:
+        model_last_used = time.time()
         return model
         
-    async with model_lock:
+    # A prefetch of this model is already running; wait for it rather than downloading twice.
+    # This happens before taking the lock and unloading, so the current model keeps serving.
+    while model_store.is_downloading(expected_model_id):
+        job = model_store.jobs[expected_model_id]
+        download_progress["status"] = "downloading"
+        download_progress["description"] = f"Downloading {size} {model_type} (prefetch)..."
+        download_progress["progress"] = job["progress"]
+        await asyncio.sleep(0.5)
+
+    async with _get_model_lock():
         if current_model_id == expected_model_id and model is not None:
+            model_last_used = time.time()
             return model
 
-        if not HAS_QWEN:
+        if not HAS_QWEN and not USE_STUB_MODEL:
             print("qwen-tts package is not installed. TTS generation will not work.")
             download_progress["status"] = "error"
             download_progress["description"] = "qwen-tts not installed."
             raise RuntimeError("qwen-tts package is not installed.")
 
+        # Editing sessions pin their model; give them a while to close before swapping it out
+        deadline = time.time() + MODEL_LOAD_WAIT
+        while model is not None and current_model_id in model_pins:
+            if time.time() >= deadline:
+                raise ModelBusyError(
+                    f"Not swapping out {current_model_id} for {expected_model_id}: "
+                    f"{model_pins[current_model_id]} editing session(s) are using it."
+                )
+            await asyncio.sleep(0.5)
+
         # Free old model from memory if we are swapping
         if model is not None:
             print(f"Unloading existing model {current_model_id} to load {expected_model_id}...")
-            del model
-            model = None
-            current_model_id = None
+            _unload_model(f"swap to {expected_model_id}")
+
+        # Queue the load briefly while over the memory ceiling, then refuse rather than risk an OOM kill
+        deadline = time.time() + MODEL_LOAD_WAIT
+        incoming = _expected_model_bytes(expected_model_id) if MODEL_RSS_LIMIT_MB else 0
+        while _over_memory_limit(incoming):
+            if time.time() >= deadline:
+                rss = _mb(current_rss_bytes())
+                _record_model_event("load_rejected", expected_model_id, limit_mb=MODEL_RSS_LIMIT_MB,
+                                    model_mb=_mb(incoming))
+                raise MemoryPressureError(
+                    f"Not loading {expected_model_id}: process RSS {rss}MB plus the model's {_mb(incoming)}MB "
+                    f"would pass the {MODEL_RSS_LIMIT_MB}MB limit."
+                )
+            await asyncio.sleep(1.0)
             gc.collect()
-            if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-                torch.mps.empty_cache()
-            elif torch.cuda.is_available():
-                torch.cuda.empty_cache()
 
         device = "cpu"
         dtype = torch.float32
@@ -173,6 +436,8 @@ async def get_tts_model(size: str = "1.7B", model_type: str = "CustomVoice"):
         try:
             model = await asyncio.to_thread(_load_model_sync, expected_model_id, device, dtype)
             current_model_id = expected_model_id
+            model_last_used = time.time()
+            _record_model_event("loaded", expected_model_id)
             download_progress["status"] = "ready"
             download_progress["description"] = "Model loaded successfully."
             download_progress["progress"] = 100.0
@@ -188,6 +453,109 @@ async def get_tts_model(size: str = "1.7B", model_type: str = "CustomVoice"):
             raise RuntimeError(f"Failed to load model: {e}")
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(uploads.UploadLimitMiddleware, limits=uploads.UPLOAD_LIMITS)
+
+@app.get("/api/health")
+def health():
+    """Liveness and load report used by router.py for routing and spillover."""
+    return {
+        "status": "ok",
+        "model": current_model_id,
+        "active": active_generations,
+        "rss_mb": _mb(current_rss_bytes()),
+        "stub": USE_STUB_MODEL,
+    }
+
+@app.get("/api/memory")
+def memory_status():
+    """Current memory reading, limits, and recent model load/eviction events."""
+    return {
+        "rss_mb": _mb(current_rss_bytes()),
+        "rss_limit_mb": MODEL_RSS_LIMIT_MB or None,
+        "idle_ttl": MODEL_IDLE_TTL or None,
+        "model": current_model_id,
+        "idle_seconds": round(time.time() - model_last_used, 1) if model is not None else None,
+        "active": active_generations,
+        "pins": dict(model_pins),
+        "events": list(model_events),
+        "samples": [{"time": t, "rss_mb": _mb(r)} for t, r in memory_samples],
+        "sentence_cache": sentences.stats(),
+        "prompt_cache": prompt_cache.stats(),
+    }
+
+def _model_id_or_400(model_size: str, model_type: str) -> str:
+    if model_size not in VALID_MODEL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid model_size. Must be one of: {', '.join(VALID_MODEL_SIZES)}")
+    if model_type not in VALID_MODEL_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid model_type. Must be one of: {', '.join(VALID_MODEL_TYPES)}")
+    return f"Qwen/Qwen3-TTS-12Hz-{model_size}-{model_type}"
+
+def _model_status(model_size: str, model_type: str):
+    model_id = _model_id_or_400(model_size, model_type)
+    return {
+        "model_id": model_id,
+        "model_size": model_size,
+        "model_type": model_type,
+        **model_store.status(model_id),
+        "loaded": current_model_id == model_id,
+        "job": model_store.public_job(model_store.jobs.get(model_id)),
+    }
+
+@app.get("/api/models")
+def list_models():
+    """Every supported model with its local snapshot state and any prefetch progress."""
+    return [_model_status(size, model_type)
+            for size in sorted(VALID_MODEL_SIZES) for model_type in sorted(VALID_MODEL_TYPES)]
+
+@app.get("/api/models/{model_size}/{model_type}")
+def get_model(model_size: str, model_type: str):
+    """One model's snapshot state, including per-file progress of a running prefetch."""
+    return _model_status(model_size, model_type)
+
+@app.post("/api/models/prefetch", status_code=202)
+def prefetch_model(model_size: str = Form(...), model_type: str = Form(...)):
+    """Download a model snapshot in the background (resuming any partial download)."""
+    model_id = _model_id_or_400(model_size, model_type)
+    return model_store.public_job(model_store.prefetch(model_id))
+
+@app.delete("/api/models/{model_size}/{model_type}")
+async def delete_model(model_size: str, model_type: str):
+    """Cancel any prefetch and delete the model from disk (our snapshot and the huggingface_hub
+    cache). A loaded model stays in memory."""
+    model_id = _model_id_or_400(model_size, model_type)
+    if not await asyncio.to_thread(model_store.delete, model_id):
+        raise HTTPException(status_code=404, detail="This model is not on disk")
+    return {"message": "Model snapshot deleted", "model_id": model_id}
+
+@app.get("/api/profiling")
+def get_profiling():
+    """Current profiling settings and the traces available for download."""
+    return {"settings": profiling.settings, "traces": profiling.list_traces()}
+
+@app.post("/api/profiling")
+def set_profiling(
+    mode: str = Form(...),
+    count: int = Form(1),
+    rate: float = Form(0.0),
+    torch_profiler: bool = Form(False)
+):
+    """
+    Select requests to trace: mode "next" traces the next `count` generations, "sample"
+    traces a `rate` fraction of them, "off" stops. Single requests can also opt in with
+    an `X-Profile` header.
+    """
+    try:
+        return profiling.configure(mode, count=count, rate=rate, torch_profiler=torch_profiler)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/traces/{filename}")
+def download_trace(filename: str):
+    path = profiling.trace_path(filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    media_type = "application/octet-stream" if filename.endswith(".pstats") else "application/json"
+    return FileResponse(path, media_type=media_type, filename=filename)
 
 @app.get("/api/progress")
 async def stream_progress(request: Request):
@@ -233,8 +601,12 @@ async def create_profile(
     safe_filename = os.path.basename(ref_audio.filename) if ref_audio.filename else "audio.wav"
     audio_path = os.path.join(PROFILES_DIR, f"{profile_id}_{safe_filename}")
     
-    with open(audio_path, "wb") as f:
-        f.write(await ref_audio.read())
+    await uploads.save_upload(ref_audio, audio_path, uploads.UPLOAD_LIMITS["/api/profiles"])
+    try:
+        uploads.audio_info(audio_path, uploads.REF_AUDIO_MAX_SECONDS, "Reference audio", strict=False)
+    except HTTPException:
+        os.remove(audio_path)
+        raise
         
     profiles = load_profiles()
     profiles.append({
@@ -268,8 +640,95 @@ def delete_profile(profile_id: str):
     
     return {"message": "Profile deleted successfully"}
 
+def public_artifact(meta):
+    """Artifact metadata as returned to clients (without the server-side path or loudness stats)."""
+    return {k: v for k, v in meta.items() if k not in ("path", "loudness")}
+
+def artifact_headers(meta):
+    return {
+        "X-Artifact-Id": meta["id"],
+        "ETag": meta["etag"],
+        "X-Audio-Duration": f"{meta['duration']:.3f}",
+        "X-Sample-Rate": str(meta["sample_rate"]),
+    }
+
+def resolve_artifacts(artifact_ids):
+    """Metadata for each id, in order; 404 if any is missing or expired."""
+    metas = []
+    for artifact_id in artifact_ids:
+        meta = artifacts.get(artifact_id)
+        if not meta:
+            raise HTTPException(status_code=404, detail=f"Artifact not found: {artifact_id}")
+        metas.append(meta)
+    return metas
+
+def parse_id_list(value: str):
+    """Accept a JSON array or a comma-separated list of ids."""
+    value = (value or "").strip()
+    if value.startswith("["):
+        try:
+            ids = json.loads(value)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid id list: {e}")
+        if not isinstance(ids, list) or not all(isinstance(v, str) for v in ids):
+            raise HTTPException(status_code=400, detail="Id list must be a JSON array of strings.")
+        return ids
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+@app.get("/api/artifacts/{artifact_id}")
+def get_artifact(artifact_id: str, request: Request, filename: str = None):
+    """Serve an artifact with ETag revalidation and single-range Range support."""
+    meta = artifacts.get(artifact_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    headers = {**artifact_headers(meta), "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=3600"}
+    if filename:
+        safe = os.path.basename(filename).replace('"', "")
+        headers["Content-Disposition"] = f'attachment; filename="{safe}"'
+
+    if meta["etag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    size = meta["size"]
+    try:
+        byte_range = artifacts.parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(artifacts.iter_file(meta["path"], start, end),
+                             status_code=status, media_type="audio/wav", headers=headers)
+
+@app.get("/api/artifacts/{artifact_id}/meta")
+def get_artifact_meta(artifact_id: str):
+    meta = artifacts.get(artifact_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return public_artifact(meta)
+
+@app.delete("/api/artifacts/{artifact_id}")
+def delete_artifact(artifact_id: str):
+    if not artifacts.get(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    artifacts.delete(artifact_id)
+    return {"message": "Artifact deleted"}
+
+def _output_format_or_400(sample_format: str, sample_rate: Optional[int]):
+    if sample_format not in audio_encoding.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid sample_format. Must be one of: {', '.join(audio_encoding.FORMATS)}")
+    if sample_rate is not None and not 8000 <= sample_rate <= 192000:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 8000 and 192000.")
+
 @app.post("/api/generate")
 async def generate_audio(
+    request: Request,
     text: str = Form(...),
     language: str = Form("English"),
     model_size: str = Form("1.7B"),
@@ -278,91 +737,140 @@ async def generate_audio(
     voice_design_prompt: str = Form(None),
     ref_text: str = Form(None),
     ref_audio: UploadFile = File(None),
-    profile_id: str = Form(None)
+    profile_id: str = Form(None),
+    return_artifact: bool = Form(False),
+    paragraph_id: str = Form(None),
+    fresh: bool = Form(False),
+    sample_format: str = Form(audio_encoding.DEFAULT_FORMAT),
+    sample_rate: Optional[int] = Form(None)
 ):
+    """
+    Generate speech. The result is always kept as an artifact (see /api/artifacts); with
+    return_artifact=true only its metadata is returned instead of the WAV body.
+    With a paragraph_id, sentences unchanged since that paragraph's last generation are reused
+    and only the edited ones are synthesized; fresh=true asks for a new take of every sentence.
+    sample_format (pcm16, pcm24, float32) and
+    sample_rate choose the encoding of the WAV; by default it is 16-bit at the model's rate.
+    Send `X-Profile: 1` (or `X-Profile: torch`) to capture a trace of this request.
+    """
     if model_size not in VALID_MODEL_SIZES:
         raise HTTPException(status_code=400, detail=f"Invalid model_size. Must be one of: {', '.join(VALID_MODEL_SIZES)}")
     if model_type not in VALID_MODEL_TYPES:
         raise HTTPException(status_code=400, detail=f"Invalid model_type. Must be one of: {', '.join(VALID_MODEL_TYPES)}")
+    _output_format_or_400(sample_format, sample_rate)
 
+    global active_generations
+    active_generations += 1
+    trace = profiling.start("generate", request.headers)
     try:
-        tts_model = await get_tts_model(model_size, model_type)
+        result = await _generate_audio(text, language, model_size, model_type, speaker,
+                                       voice_design_prompt, ref_text, ref_audio, profile_id,
+                                       return_artifact, paragraph_id, sample_format, sample_rate, fresh)
+    finally:
+        active_generations -= 1
+        summary = await profiling.finish(trace) if trace else None
+
+    if summary:
+        if isinstance(result, dict):
+            result = JSONResponse(result)
+        result.headers["X-Trace-Id"] = summary["id"]
+        result.headers["Server-Timing"] = profiling.server_timing(summary)
+    return result
+
+async def _generate_audio(text, language, model_size, model_type, speaker,
+                          voice_design_prompt, ref_text, ref_audio, profile_id,
+                          return_artifact=False, paragraph_id=None,
+                          sample_format=audio_encoding.DEFAULT_FORMAT, sample_rate=None, fresh=False):
+    try:
+        with profiling.span("model_fetch"):
+            tts_model = await get_tts_model(model_size, model_type)
+    except (MemoryPressureError, ModelBusyError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
     try:
         # Generate speech based on requested model type
-        if model_type == "CustomVoice":
-            wavs, sr = await asyncio.to_thread(
-                tts_model.generate_custom_voice,
-                text=text,
-                language=language,
-                speaker=speaker,
-                temperature=0.3,
-                repetition_penalty=1.1,
-                top_p=0.8,
-                subtalker_temperature=0.3
-            )
-        elif model_type == "VoiceDesign":
-            if not voice_design_prompt:
-                raise HTTPException(status_code=400, detail="voice_design_prompt is required for VoiceDesign models.")
-            wavs, sr = await asyncio.to_thread(
-                tts_model.generate_voice_design,
-                text=text,
-                language=language,
-                instruct=voice_design_prompt,
-                temperature=0.3,
-                repetition_penalty=1.1,
-                top_p=0.8,
-                subtalker_temperature=0.3
-            )
-        elif model_type == "Base":
-            if profile_id:
-                # Load from saved profile
-                profiles = load_profiles()
-                profile = next((p for p in profiles if p["id"] == profile_id), None)
-                if not profile:
-                    raise HTTPException(status_code=404, detail="Profile not found")
-
-                temp_audio_path = profile["audio_path"]
-                actual_ref_text = profile["ref_text"]
-                cleanup_audio = False
-            else:
-                # Use uploaded ad-hoc files
-                if not ref_text or not ref_audio:
-                    raise HTTPException(status_code=400, detail="ref_text and ref_audio (or profile_id) are required for Voice Cloning in Base models.")
-                safe_name = os.path.basename(ref_audio.filename) if ref_audio.filename else "upload.wav"
-                temp_audio_path = os.path.join(DATA_DIR, f"{uuid.uuid4()}_{safe_name}")
-                os.makedirs(DATA_DIR, exist_ok=True)
-                with open(temp_audio_path, "wb") as f:
-                    f.write(await ref_audio.read())
-                actual_ref_text = ref_text
-                cleanup_audio = True
-
-            wavs, sr = await asyncio.to_thread(
-                tts_model.generate_voice_clone,
-                text=text,
-                language=language,
-                ref_audio=temp_audio_path,
-                ref_text=actual_ref_text,
-                temperature=0.3,
-                repetition_penalty=1.1,
-                top_p=0.8,
-                subtalker_temperature=0.3
-            )
+        cleanup_audio = False
+        temp_audio_path = None
+        actual_ref_text = None
+        if model_type == "VoiceDesign" and not voice_design_prompt:
+            raise HTTPException(status_code=400, detail="voice_design_prompt is required for VoiceDesign models.")
+        if model_type == "Base":
+            with profiling.span("profile_load"):
+                if profile_id:
+                    # Load from saved profile
+                    profile = find_profile(profile_id)
+                    if not profile:
+                        raise HTTPException(status_code=404, detail="Profile not found")
 
+                    temp_audio_path = profile["audio_path"]
+                    actual_ref_text = profile["ref_text"]
+                else:
+                    # Use uploaded ad-hoc files
+                    if not ref_text or not ref_audio:
+                        raise HTTPException(status_code=400, detail="ref_text and ref_audio (or profile_id) are required for Voice Cloning in Base models.")
+                    safe_name = os.path.basename(ref_audio.filename) if ref_audio.filename else "upload.wav"
+                    temp_audio_path = os.path.join(DATA_DIR, f"{uuid.uuid4()}_{safe_name}")
+                    os.makedirs(DATA_DIR, exist_ok=True)
+                    await uploads.save_upload(ref_audio, temp_audio_path, uploads.UPLOAD_LIMITS["/api/generate"])
+                    actual_ref_text = ref_text
+                    cleanup_audio = True
+                    try:
+                        uploads.audio_info(temp_audio_path, uploads.REF_AUDIO_MAX_SECONDS, "Reference audio", strict=False)
+                    except HTTPException:
+                        os.remove(temp_audio_path)
+                        raise
+
+        model_id = _model_id_or_400(model_size, model_type)
+        voice = {"speaker": speaker, "instruct": voice_design_prompt,
+                 "ref_audio": temp_audio_path, "ref_text": actual_ref_text}
+        voice_key = None
+        extra = {}
+        try:
+            if model_type == "Base":
+                # Ad-hoc uploads land at a fresh path each time, so key them by content
+                voice_key = (f"profile:{profile_id}" if profile_id else
+                             await asyncio.to_thread(hashing.sha256_file, temp_audio_path))
+                voice["voice_clone_prompt"] = await profiling.to_thread(
+                    "voice_prompt", voice_clone_prompt_for, tts_model, model_id, voice_key,
+                    temp_audio_path, actual_ref_text,
+                )
+            if paragraph_id:
+                fingerprint = voice_fingerprint(model_id, model_type, language, speaker,
+                                                voice_design_prompt, voice_key, actual_ref_text)
+                wav, sr, reused, count = await profiling.to_thread(
+                    "inference", synthesize_paragraph_sync, tts_model, model_type, text, language,
+                    paragraph_id, fingerprint, fresh=fresh, profile_call=True, **voice,
+                )
+                extra.update(paragraph_id=paragraph_id, sentences=count, sentences_reused=reused)
+            else:
+                wavs, sr = await profiling.to_thread(
+                    "inference", synthesize_sync, tts_model, model_type, text, language,
+                    profile_call=True, **voice,
+                )
+                wav = wavs[0]
+        finally:
             # Cleanup temp file if it was a temporary upload
             if cleanup_audio and os.path.exists(temp_audio_path):
                 os.remove(temp_audio_path)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported model_type: {model_type}")
 
-        # Stream audio directly from memory — no temp file needed
-        audio_data = wavs[0]
-        buffer = io.BytesIO()
-        sf.write(buffer, audio_data, sr, format="WAV")
-        buffer.seek(0)
-        return StreamingResponse(buffer, media_type="audio/wav", headers={"Content-Disposition": "attachment; filename=generated.wav"})
+        if sample_rate and sample_rate != sr:
+            wav = await profiling.to_thread("resample", audio_encoding.resample, wav, sr, sample_rate)
+            sr = sample_rate
+        # Measured once here so exports can normalize without another pass over the audio
+        extra["loudness"] = await profiling.to_thread("measure", loudness.analyze, wav, sr)
+        audio = await profiling.to_thread("encode", audio_encoding.encode_wav, wav, sr, sample_format)
+        meta = await profiling.to_thread("store", artifacts.store_bytes, audio, "generated", extra)
+        if return_artifact:
+            return public_artifact(meta)
+
+        # The encoded buffer is sent as-is, with its Content-Length
+        return Response(
+            content=memoryview(audio),
+            media_type="audio/wav",
+            headers={"Content-Disposition": "attachment; filename=generated.wav", **artifact_headers(meta)},
+        )
 
     except HTTPException:
         raise
@@ -371,37 +879,398 @@ async def generate_audio(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Edits to the same paragraph that arrive within this window are coalesced into one generation
+SESSION_EDIT_DEBOUNCE = 0.4
+# Paragraphs one session generates at once (the UI keeps up to 3 in flight)
+SESSION_CONCURRENCY = int(os.environ.get("TTS_SESSION_CONCURRENCY", 3))
+
+class EditSession:
+    """State for one /api/session WebSocket.
+
+    The client configures the voice once; paragraph upserts are queued per paragraph id so
+    only the latest text of a paragraph is ever synthesized, and results for text that was
+    edited again (or deleted) while generating are dropped instead of sent. Up to
+    SESSION_CONCURRENCY paragraphs are generated at once, and the configured model stays pinned
+    (see model_pins) until the session is reconfigured or closed.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.config = None
+        self.voice = {}  # Resolved per-session voice: ref_audio/ref_text (Base profiles)
+        self.fingerprint = None  # Voice identity for reusing sentence audio across edits
+        self.pending = {}  # paragraph_id -> {"text", "version", "updated", "fresh"}
+        self.versions = {}  # paragraph_id -> latest version number
+        # Versions come from one counter for the whole session and never repeat, so a paragraph
+        # deleted and re-created under the same id cannot match a result for its old text
+        self.last_version = 0
+        self.running = set()  # paragraph_ids being generated; a newer edit waits for its turn
+        self.tasks = set()
+        self.pinned = None  # model_id this session holds a pin on
+        self.wakeup = asyncio.Event()
+        self.send_lock = asyncio.Lock()
+
+    async def send_json(self, data):
+        async with self.send_lock:
+            await self.websocket.send_json(data)
+
+    async def send_audio(self, header, audio: bytes):
+        # The JSON header and its binary frame must not interleave with other messages
+        async with self.send_lock:
+            await self.websocket.send_json(header)
+            await self.websocket.send_bytes(audio)
+
+    async def configure(self, msg):
+        model_size = msg.get("model_size", "1.7B")
+        model_type = msg.get("model_type", "CustomVoice")
+        if model_size not in VALID_MODEL_SIZES:
+            raise ValueError(f"Invalid model_size. Must be one of: {', '.join(VALID_MODEL_SIZES)}")
+        if model_type not in VALID_MODEL_TYPES:
+            raise ValueError(f"Invalid model_type. Must be one of: {', '.join(VALID_MODEL_TYPES)}")
+        if model_type == "VoiceDesign" and not msg.get("voice_design_prompt"):
+            raise ValueError("voice_design_prompt is required for VoiceDesign models.")
+        sample_rate = msg.get("sample_rate")
+        if sample_rate is not None:
+            try:
+                sample_rate = int(sample_rate)
+            except (TypeError, ValueError):
+                raise ValueError("sample_rate must be an integer.")
+        try:
+            _output_format_or_400(msg.get("sample_format", audio_encoding.DEFAULT_FORMAT), sample_rate)
+        except HTTPException as e:
+            raise ValueError(e.detail)
+
+        profile = None
+        if model_type == "Base":
+            # Checked before loading so a bad profile id does not swap out the current model
+            profile = find_profile(msg.get("profile_id"))
+            if not profile:
+                raise ValueError("Profile not found")
+
+        model_id = f"Qwen/Qwen3-TTS-12Hz-{model_size}-{model_type}"
+        if self.pinned != model_id:
+            # Our own pin must not block this session from switching models
+            self.unpin()
+        tts_model = await get_tts_model(model_size, model_type)
+        if self.pinned != model_id:
+            pin_model(model_id)
+            self.pinned = model_id
+        voice = {}
+        voice_key = None
+        if profile:
+            voice = {"ref_audio": profile["audio_path"], "ref_text": profile["ref_text"]}
+            voice_key = f"profile:{profile['id']}"
+            # Build the prompt now so the first paragraph does not wait for it. It stays in
+            # prompt_cache only (not on the session), so unloading the model really frees it.
+            await asyncio.to_thread(
+                voice_clone_prompt_for, tts_model, f"Qwen/Qwen3-TTS-12Hz-{model_size}-{model_type}",
+                voice_key, voice["ref_audio"], voice["ref_text"],
+            )
+
+        self.config = {
+            "model_size": model_size,
+            "model_type": model_type,
+            "language": msg.get("language", "English"),
+            "speaker": msg.get("speaker", "Vivian"),
+            "voice_design_prompt": msg.get("voice_design_prompt"),
+            "profile_id": msg.get("profile_id"),
+            "artifacts_only": bool(msg.get("artifacts_only", False)),
+            "sample_format": msg.get("sample_format", audio_encoding.DEFAULT_FORMAT),
+            "sample_rate": sample_rate,
+            "voice_key": voice_key,
+        }
+        self.voice = voice
+        c = self.config
+        self.fingerprint = voice_fingerprint(
+            f"Qwen/Qwen3-TTS-12Hz-{model_size}-{model_type}", model_type, c["language"], c["speaker"],
+            c["voice_design_prompt"], f"profile:{c['profile_id']}", voice.get("ref_text"),
+        )
+        await self.send_json({"type": "configured", "model": f"Qwen/Qwen3-TTS-12Hz-{model_size}-{model_type}"})
+
+    async def upsert(self, paragraph_id: str, text: str, fresh: bool = False):
+        self.last_version += 1
+        version = self.last_version
+        self.versions[paragraph_id] = version
+        # Replacing the pending entry is what coalesces rapid edits
+        self.pending[paragraph_id] = {"text": text, "version": version, "updated": time.monotonic(),
+                                      "fresh": fresh}
+        self.wakeup.set()
+        await self.send_json({"type": "status", "paragraph_id": paragraph_id, "state": "queued", "version": version})
+
+    async def delete(self, paragraph_id: str):
+        self.pending.pop(paragraph_id, None)
+        self.versions.pop(paragraph_id, None)
+        await self.send_json({"type": "status", "paragraph_id": paragraph_id, "state": "deleted"})
+
+    def unpin(self):
+        if self.pinned:
+            unpin_model(self.pinned)
+            self.pinned = None
+
+    def _next_ready(self):
+        """Oldest pending paragraph whose text has settled, or the seconds until one will.
+        Paragraphs still generating an older version are skipped until that finishes."""
+        now = time.monotonic()
+        wait = None
+        for paragraph_id, item in self.pending.items():
+            if paragraph_id in self.running:
+                continue
+            remaining = SESSION_EDIT_DEBOUNCE - (now - item["updated"])
+            if remaining <= 0:
+                return paragraph_id, None
+            wait = remaining if wait is None else min(wait, remaining)
+        return None, wait
+
+    async def run_worker(self):
+        try:
+            while True:
+                paragraph_id, wait = None, None
+                if len(self.running) < SESSION_CONCURRENCY:
+                    paragraph_id, wait = self._next_ready()
+                if paragraph_id is None:
+                    # Woken by an upsert or by a generation finishing
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                item = self.pending.pop(paragraph_id)
+                self.running.add(paragraph_id)
+                task = asyncio.create_task(self.generate(paragraph_id, item))
+                self.tasks.add(task)
+                task.add_done_callback(lambda t, pid=paragraph_id: self._finished(t, pid))
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
+
+    def _finished(self, task, paragraph_id):
+        self.tasks.discard(task)
+        self.running.discard(paragraph_id)
+        self.wakeup.set()
+
+    async def generate(self, paragraph_id: str, item: dict):
+        global active_generations
+        config = self.config
+        if config is None:
+            await self.send_json({"type": "error", "paragraph_id": paragraph_id,
+                                  "detail": "Session is not configured."})
+            return
+
+        await self.send_json({"type": "status", "paragraph_id": paragraph_id,
+                              "state": "generating", "version": item["version"]})
+        active_generations += 1
+        try:
+            tts_model = await get_tts_model(config["model_size"], config["model_type"])
+            voice = dict(self.voice)
+            if config["voice_key"]:
+                # Looked up per paragraph: the model (and with it the cache) may have been reloaded
+                voice["voice_clone_prompt"] = await asyncio.to_thread(
+                    voice_clone_prompt_for, tts_model,
+                    f"Qwen/Qwen3-TTS-12Hz-{config['model_size']}-{config['model_type']}",
+                    config["voice_key"], voice["ref_audio"], voice["ref_text"],
+                )
+            # Only sentences changed since this paragraph's last generation are synthesized,
+            # unless the client asked for a fresh take
+            wav, sr, reused, count = await asyncio.to_thread(
+                synthesize_paragraph_sync, tts_model, config["model_type"], item["text"], config["language"],
+                paragraph_id, self.fingerprint, item["fresh"],
+                speaker=config["speaker"],
+                instruct=config["voice_design_prompt"],
+                **voice,
+            )
+            if config["sample_rate"] and config["sample_rate"] != sr:
+                wav = await asyncio.to_thread(audio_encoding.resample, wav, sr, config["sample_rate"])
+                sr = config["sample_rate"]
+            stats = await asyncio.to_thread(loudness.analyze, wav, sr)
+            audio = await asyncio.to_thread(audio_encoding.encode_wav, wav, sr, config["sample_format"])
+            meta = await asyncio.to_thread(artifacts.store_bytes, audio, "generated",
+                                           {"paragraph_id": paragraph_id, "sentences": count,
+                                            "sentences_reused": reused, "loudness": stats})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            await self.send_json({"type": "error", "paragraph_id": paragraph_id,
+                                  "version": item["version"], "detail": str(e)})
+            return
+        finally:
+            active_generations -= 1
+
+        if self.versions.get(paragraph_id) != item["version"]:
+            # Edited again or deleted while we were generating; the newer request wins
+            return
+        header = {"type": "audio", "paragraph_id": paragraph_id, "version": item["version"],
+                  "artifact": public_artifact(meta)}
+        if config["artifacts_only"]:
+            # The client plays and exports by artifact id, so skip the audio frame
+            await self.send_json(header)
+        else:
+            header["bytes"] = len(audio)
+            await self.send_audio(header, audio)
+
+@app.websocket("/api/session")
+async def edit_session(websocket: WebSocket):
+    """
+    Persistent editing session. Client messages (JSON):
+      {"type": "configure", "model_size", "model_type", "language", "speaker", "voice_design_prompt",
+       "profile_id", "artifacts_only", "sample_format", "sample_rate"}
+      {"type": "upsert", "paragraph_id", "text", "fresh"}
+      {"type": "delete", "paragraph_id"}
+    Server replies with "configured", "status" and "error" JSON messages; generated audio is an
+    "audio" JSON header carrying the artifact metadata, followed immediately by one binary WAV
+    frame unless the session was configured with artifacts_only.
+    """
+    await websocket.accept()
+    session = EditSession(websocket)
+    worker = asyncio.create_task(session.run_worker())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                msg = json.loads(message.get("text") or message.get("bytes") or "")
+            except ValueError as e:
+                await session.send_json({"type": "error", "detail": f"Invalid JSON: {e}"})
+                continue
+            if not isinstance(msg, dict):
+                await session.send_json({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            kind = msg.get("type")
+            try:
+                if kind == "configure":
+                    await session.configure(msg)
+                elif kind == "upsert":
+                    await session.upsert(str(msg["paragraph_id"]), msg.get("text", ""), bool(msg.get("fresh")))
+                elif kind == "delete":
+                    await session.delete(str(msg["paragraph_id"]))
+                else:
+                    await session.send_json({"type": "error", "detail": f"Unknown message type: {kind}"})
+            except (KeyError, ValueError, RuntimeError) as e:
+                await session.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
+        session.unpin()
+
+MERGE_BLOCK_FRAMES = 65536  # Frames per read/write while streaming a merge
+MERGE_SILENCE_SECONDS = 1.0
+
+def _merge_stream(sources, out_path: str, gain_db: float = 0.0, limit_db: float = None,
+                  subtype: str = "PCM_16"):
+    """
+    Concatenate WAV sources (paths or file objects) into out_path with silence between them,
+    one block at a time so memory stays bounded regardless of total length. The blocks are
+    scaled by gain_db and, with limit_db, run through a peak limiter on the way out.
+    Returns False (nothing written) if the sources do not share a sample rate.
+    """
+    infos = [sf.info(src) for src in sources]
+    for src in sources:
+        if hasattr(src, "seek"):
+            src.seek(0)
+    sample_rate = infos[0].samplerate
+    if any(info.samplerate != sample_rate for info in infos):
+        return False
+    channels = max(info.channels for info in infos)
+
+    gain = np.float32(10 ** (gain_db / 20))
+    limiter = None
+    if limit_db is not None:
+        limiter = loudness.PeakLimiter(limit_db - loudness.TRUE_PEAK_MARGIN_DB, sample_rate)
+
+    silence = np.zeros((int(sample_rate * MERGE_SILENCE_SECONDS), channels), dtype=np.float32)
+    with sf.SoundFile(out_path, "w", samplerate=sample_rate, channels=channels,
+                      subtype=subtype, format="WAV") as out:
+        def write(block):
+            # The limiter delays its output, so everything (silence too) goes through it
+            out.write(limiter.process(block) if limiter else block)
+
+        for idx, src in enumerate(sources):
+            if idx > 0:
+                write(silence)
+            with sf.SoundFile(src) as f:
+                for block in f.blocks(blocksize=MERGE_BLOCK_FRAMES, dtype="float32", always_2d=True):
+                    if block.shape[1] != channels:
+                        # Up-mix mono segments into a stereo merge
+                        block = np.repeat(block[:, :1], channels, axis=1)
+                    if gain != 1:
+                        block *= gain
+                    write(block)
+        tail = limiter.flush() if limiter else None
+        if tail is not None:
+            out.write(tail)
+    return True
+
+def _merge_pydub(sources, out_path: str):
+    """Fallback merge that resamples mismatched segments; holds the whole result in memory."""
+    combined = AudioSegment.empty()
+    silence = AudioSegment.silent(duration=int(MERGE_SILENCE_SECONDS * 1000))
+    for idx, src in enumerate(sources):
+        if hasattr(src, "seek"):
+            src.seek(0)
+        segment = AudioSegment.from_wav(src)
+        if idx > 0:
+            combined += silence
+        combined += segment
+    combined.export(out_path, format="wav")
+
 @app.post("/api/merge")
-async def merge_audio(files: List[UploadFile] = File(...)):
-    if not files:
+async def merge_audio(files: List[UploadFile] = File(None), artifact_ids: str = Form(None),
+                      normalize_for: str = Form(None)):
+    """
+    Merge segments with 1s of silence between them. Segments are either uploaded files
+    (the merged WAV is returned) or artifact ids (the merged artifact's metadata is returned).
+
+    With artifact ids and normalize_for=<treatment>, the merge is also loudness-normalized for
+    that /api/treat treatment from the segments' stored measurements, so the treatment only
+    has to apply its EQ afterwards.
+    """
+    ids = parse_id_list(artifact_ids)
+    if not files and not ids:
         raise HTTPException(status_code=400, detail="No files provided")
-        
-    try:
-        # Read all uploads into memory first (async), then merge in a thread
-        file_contents = []
-        for file in files:
-            file_contents.append(await file.read())
+    if normalize_for and normalize_for not in loudness.TREATMENT_EQ:
+        raise HTTPException(status_code=400, detail=f"Invalid normalize_for. Must be one of: {', '.join(loudness.TREATMENT_EQ)}")
 
+    norm = None
+    if ids:
+        metas = resolve_artifacts(ids)
+        sources = [meta["path"] for meta in metas]
+        if normalize_for and all(meta.get("loudness") for meta in metas):
+            norm = loudness.plan([meta["loudness"]["stats"][normalize_for] for meta in metas])
+            norm["treatment"] = normalize_for
+            # Treatments with EQ change the peaks, so their limiting happens after the EQ in /api/treat
+            norm["limited_in_merge"] = norm["limit_db"] is not None and loudness.TREATMENT_EQ[normalize_for] is None
+    else:
+        # Decode straight from the spooled upload files; nothing is copied into memory
+        sources = [uploads.rewind(file) for file in files]
+    total = sum(uploads.audio_info(src, label="segment").duration for src in sources)
+    if total > uploads.EXPORT_MAX_SECONDS:
+        raise HTTPException(status_code=413, detail=f"Merged audio would be {total:.0f}s; the limit is {uploads.EXPORT_MAX_SECONDS:.0f}s.")
+
+    try:
         def _merge_sync():
-            combined = AudioSegment.empty()
-            silence = AudioSegment.silent(duration=1000)
-            for idx, content in enumerate(file_contents):
-                temp_in = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                temp_in.write(content)
-                temp_in.flush()
-                temp_in.close()
-                segment = AudioSegment.from_wav(temp_in.name)
-                if idx > 0:
-                    combined += silence
-                combined += segment
-                os.unlink(temp_in.name)
+            nonlocal norm
             temp_out = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
             temp_out.close()
-            combined.export(temp_out.name, format="wav")
+            gain_db = norm["gain_db"] if norm else 0.0
+            limit_db = norm["limit_db"] if norm and norm["limited_in_merge"] else None
+            # Peaks limited later by /api/treat may pass full scale until then; keep them in float
+            deferred = norm and norm["limit_db"] is not None and not norm["limited_in_merge"]
+            subtype = "FLOAT" if deferred else "PCM_16"
+            if not _merge_stream(sources, temp_out.name, gain_db, limit_db, subtype):
+                _merge_pydub(sources, temp_out.name)
+                norm = None  # Resampled segments no longer match their measurements
             return temp_out.name
 
         out_path = await asyncio.to_thread(_merge_sync)
 
+        if ids:
+            meta = await asyncio.to_thread(artifacts.store_file, out_path, "merged",
+                                           {"normalized": norm} if norm else None)
+            return public_artifact(meta)
+
         return FileResponse(
             out_path,
             media_type="audio/wav",
@@ -413,44 +1282,72 @@ async def merge_audio(files: List[UploadFile] = File(...)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to merge audio: {str(e)}")
 
+# EQ of each treatment, applied ahead of loudness normalization. loudness.TREATMENT_EQ holds
+# the same curves as biquads so segments can be measured as they will sound after the EQ.
+TREATMENT_EQ_FILTERS = {
+    # Loudness normalization only — zero coloration, just standardized level
+    "podcast": None,
+    # Strong low shelf (+6dB at 200Hz) for noticeably warm, full-bodied sound
+    "warmth": "bass=g=6:f=200",
+    # Strong high shelf (+7dB at 2kHz) for noticeably crisp, airy, bright sound
+    "clear": "treble=g=7:f=2000",
+}
+LOUDNORM_FILTER = f"loudnorm=I={loudness.TARGET_LUFS:g}:TP={loudness.TARGET_TRUE_PEAK:g}:LRA=11"
+
 @app.post("/api/treat")
 async def treat_audio(
-    audio_file: UploadFile = File(...),
-    treatment_type: str = Form(...)
+    audio_file: UploadFile = File(None),
+    treatment_type: str = Form(...),
+    artifact_id: str = Form(None)
 ):
     """
-    Apply ffmpeg audio enhancements to an uploaded audio file and return the processed file.
+    Apply ffmpeg audio enhancements to an uploaded audio file or an artifact. Uploads get the
+    processed file back; artifacts get the metadata of a new treated artifact.
+    Artifacts merged with normalize_for=<this treatment> are already at the target loudness,
+    so only the EQ (and a limiter, if the merge planned one) is applied to them.
     """
-    if not audio_file:
+    if not audio_file and not artifact_id:
         raise HTTPException(status_code=400, detail="No audio file provided.")
         
-    valid_treatments = ["podcast", "warmth", "clear"]
+    valid_treatments = list(TREATMENT_EQ_FILTERS)
     if treatment_type not in valid_treatments:
         raise HTTPException(status_code=400, detail=f"Invalid treatment type. Must be one of: {', '.join(valid_treatments)}")
 
+    temp_input = None
+    normalized = None
     try:
-        # Save the uploaded file to a temporary location
-        content = await audio_file.read()
-        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        temp_input.write(content)
-        temp_input.flush()
-        temp_input.close()
+        if artifact_id:
+            source = resolve_artifacts([artifact_id])[0]
+            input_path = source["path"]
+            normalized = source.get("normalized")
+            if normalized and normalized["treatment"] != treatment_type:
+                normalized = None
+        else:
+            # Stream the uploaded file to a temporary location for ffmpeg
+            temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
+            temp_input.close()
+            await uploads.save_upload(audio_file, temp_input.name, uploads.UPLOAD_LIMITS["/api/treat"])
+            input_path = temp_input.name
+        # ffmpeg reads more formats than libsndfile, so only enforce the duration when we can read it
+        uploads.audio_info(input_path, uploads.EXPORT_MAX_SECONDS, "Audio", strict=False)
 
         # Define output file
         temp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
         temp_output.close()
 
         # Determine the ffmpeg filter chain based on treatment_type
-        filter_chain = ""
-        if treatment_type == "podcast":
-            # Loudness normalization only — zero coloration, just standardized level
-            filter_chain = "loudnorm=I=-16:TP=-1.5:LRA=11"
-        elif treatment_type == "warmth":
-            # Strong low shelf (+6dB at 200Hz) for noticeably warm, full-bodied sound
-            filter_chain = "bass=g=6:f=200,loudnorm=I=-16:TP=-1.5:LRA=11"
-        elif treatment_type == "clear":
-            # Strong high shelf (+7dB at 2kHz) for noticeably crisp, airy, bright sound
-            filter_chain = "treble=g=7:f=2000,loudnorm=I=-16:TP=-1.5:LRA=11"
+        filters = [TREATMENT_EQ_FILTERS[treatment_type]]
+        if normalized is None:
+            filters.append(LOUDNORM_FILTER)
+        elif normalized["limit_db"] is not None and not normalized["limited_in_merge"]:
+            # Gain was applied in the merge; only the post-EQ peaks still need limiting
+            limit = 10 ** ((normalized["limit_db"] - loudness.TRUE_PEAK_MARGIN_DB) / 20)
+            filters.append(f"alimiter=limit={limit:.4f}:level=disabled")
+        filter_chain = ",".join(f for f in filters if f)
+        if not filter_chain:
+            # Already normalized and nothing to EQ: the artifact is the result
+            os.unlink(temp_output.name)
+            return public_artifact(source)
 
         # Execute ffmpeg
         ffmpeg_cmd = "ffmpeg"
@@ -460,7 +1357,7 @@ async def treat_audio(
         command = [
             ffmpeg_cmd,
             "-y",  # Overwrite output file if it exists
-            "-i", temp_input.name,
+            "-i", input_path,
             "-af", filter_chain,
             temp_output.name
         ]
@@ -474,10 +1371,17 @@ async def treat_audio(
         
         if process.returncode != 0:
             print(f"ffmpeg error: {stderr.decode()}")
+            os.unlink(temp_output.name)
             raise RuntimeError(f"ffmpeg processing failed")
 
         # Clean up input file immediately since processing is done
-        os.unlink(temp_input.name)
+        if temp_input:
+            os.unlink(temp_input.name)
+
+        if artifact_id:
+            meta = await asyncio.to_thread(artifacts.store_file, temp_output.name, "treated",
+                                           {"treatment": treatment_type})
+            return public_artifact(meta)
 
         return FileResponse(
             temp_output.name,
@@ -486,41 +1390,49 @@ async def treat_audio(
             background=BackgroundTask(os.unlink, temp_output.name)
         )
 
+    except HTTPException:
+        if temp_input and os.path.exists(temp_input.name):
+            os.unlink(temp_input.name)
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         # Ensure input file is cleaned up on error if it was created
-        if 'temp_input' in locals() and os.path.exists(temp_input.name):
+        if temp_input and os.path.exists(temp_input.name):
             os.unlink(temp_input.name)
         raise HTTPException(status_code=500, detail=f"Failed to treat audio: {str(e)}")
 
+UPDATE_CACHE_FILE = os.path.join(DATA_DIR, "update_check.json")
+
 @app.get("/api/check_update")
-async def check_update():
+async def check_update(force: bool = False):
     try:
-        response = await asyncio.to_thread(requests.get, f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest")
-        response.raise_for_status()
-        data = response.json()
-        
+        data = await asyncio.to_thread(
+            updater.fetch_latest_release, updater.releases_url(GITHUB_REPO), UPDATE_CACHE_FILE, force=force
+        )
+
         latest_version = data.get("tag_name", "").lstrip("v")
-        
-        if latest_version and latest_version > APP_VERSION:
-            assets = data.get("assets", [])
-            download_url = None
-            for asset in assets:
-                if asset["name"].endswith(".zip"):
-                    download_url = asset["browser_download_url"]
-                    break
-            
-            if download_url:
-                return {"update_available": True, "latest_version": latest_version, "download_url": download_url}
-                
+
+        if latest_version and updater.version_tuple(latest_version) > updater.version_tuple(APP_VERSION):
+            zip_asset = updater.find_asset(data, lambda name: name.endswith(".zip"))
+            manifest_asset = updater.find_asset(data, lambda name: name == updater.MANIFEST_ASSET)
+
+            if zip_asset:
+                return {
+                    "update_available": True,
+                    "latest_version": latest_version,
+                    "download_url": zip_asset["browser_download_url"],
+                    "sha256": updater.asset_sha256(zip_asset),
+                    "manifest_url": manifest_asset["browser_download_url"] if manifest_asset else None,
+                }
+
     except Exception as e:
         print(f"Update check failed: {e}")
-        
+
     return {"update_available": False}
 
 @app.post("/api/do_update")
-async def do_update(download_url: str = Form(...)):
+async def do_update(download_url: str = Form(...), manifest_url: Optional[str] = Form(None), sha256: Optional[str] = Form(None)):
     if not getattr(sys, 'frozen', False):
         raise HTTPException(status_code=400, detail="Cannot perform OTA update on unpacked source code. Must be a PyInstaller build.")
 
@@ -530,40 +1442,41 @@ async def do_update(download_url: str = Form(...)):
         if not app_path.endswith(".app"):
             raise HTTPException(status_code=400, detail="Current executable is not inside a standard macOS .app bundle structure.")
 
-        # Download the zip
         temp_dir = tempfile.mkdtemp(prefix="tts_update_")
-        zip_path = os.path.join(temp_dir, "update.zip")
-        
-        def _download_and_extract():
-            r = requests.get(download_url, stream=True)
-            r.raise_for_status()
-            with open(zip_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192): 
-                    f.write(chunk)
-            # Extact zip
-            import zipfile
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-        
-        await asyncio.to_thread(_download_and_extract)
-        
-        # Look for the new .app bundle
-        extracted_app_path = None
-        for item in os.listdir(temp_dir):
-            if item.endswith(".app"):
-                extracted_app_path = os.path.join(temp_dir, item)
-                break
-                
-        if not extracted_app_path:
-            raise Exception("No .app bundle found in the downloaded zip.")
+
+        # Delta update: fetch only the files whose hashes changed, falling back to the full zip
+        script_body = None
+        if manifest_url:
+            try:
+                manifest = await asyncio.to_thread(updater.fetch_manifest, manifest_url)
+                sha256 = sha256 or manifest.get("zip", {}).get("sha256")
+                if manifest.get("base_url"):
+                    changed, removed = await asyncio.to_thread(updater.plan_delta, manifest, app_path)
+                    staging_dir = os.path.join(temp_dir, "staged")
+                    os.makedirs(staging_dir, exist_ok=True)
+                    fetched = await asyncio.to_thread(updater.stage_delta, manifest, changed, staging_dir)
+                    removed_list = os.path.join(temp_dir, "removed.txt")
+                    with open(removed_list, "w") as f:
+                        f.write("".join(path + "\n" for path in removed))
+                    print(f"Delta update: {len(changed)} changed ({fetched / 1e6:.1f} MB), {len(removed)} removed")
+                    script_body = f'''ditto "{staging_dir}" "{app_path}"
+while IFS= read -r f; do rm -f "{app_path}/$f"; done < "{removed_list}"'''
+            except Exception as e:
+                print(f"Delta update failed ({e}); downloading the full release")
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                os.makedirs(temp_dir, exist_ok=True)
+
+        if script_body is None:
+            extracted_app_path = await asyncio.to_thread(updater.download_full, download_url, temp_dir, sha256)
+            script_body = f'''rm -rf "{app_path}"
+mv "{extracted_app_path}" "{app_path}"'''
 
         # Create bash script to replace the app
         script_path = os.path.join(temp_dir, "update.sh")
         with open(script_path, "w") as f:
             f.write(f'''#!/bin/bash
 sleep 4
-rm -rf "{app_path}"
-mv "{extracted_app_path}" "{app_path}"
+{script_body}
 open "{app_path}"
 rm -rf "{temp_dir}"
 ''')
@@ -0,0 +1,373 @@
+"""
+Local model snapshots with background, resumable prefetch.
+
+Snapshots live in MODELS_DIR/<org>--<name>/ and are written by our own downloader rather than
+the huggingface_hub cache so that every model and every file gets its own progress entry
+(the lazy path in get_tts_model reports through one shared dict). Files are fetched
+concurrently into "<file>.part" and resumed with HTTP Range after an interruption or restart;
+a snapshot is only used for loading once its ".complete.json" manifest is written.
+
+Each job resolves REVISION to a commit sha when it starts and downloads that commit only, so a
+repo update between an interruption and the resume cannot mix two revisions in one file; .part
+files left by a different commit are discarded. Every file is checked against the tree
+listing's hash (sha256 for LFS files, the git blob id otherwise) before it is moved into place.
+
+The Hub endpoint follows huggingface_hub's HF_ENDPOINT variable, so a local stand-in server
+that serves /api/models/<repo>/revision/<rev>, /api/models/<repo>/tree/<sha> and
+/<repo>/resolve/<sha>/<path> works for testing.
+
+Models that the lazy path already put in the huggingface_hub cache count as downloaded too:
+status() reports them, prefetch() does not fetch a second copy, and delete() removes them.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+
+import hashing
+
+# huggingface_hub comes with qwen_tts; without it there is no cache to look in
+try:
+    from huggingface_hub import scan_cache_dir
+    HAS_HF_HUB = True
+except ImportError:
+    HAS_HF_HUB = False
+
+HF_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+REVISION = "main"  # Branch to follow; each job pins the commit it points at when the job starts
+DOWNLOAD_WORKERS = int(os.environ.get("TTS_PREFETCH_WORKERS", 4))
+CHUNK_SIZE = 1024 * 1024
+HF_CACHE_DIR = None  # None: huggingface_hub's default cache (HF_HUB_CACHE / HF_HOME)
+MAX_RETRIES = 5
+MANIFEST = ".complete.json"
+REVISION_FILE = ".revision"  # Commit the .part files in a snapshot dir belong to
+
+_state = {"dir": None}
+_lock = threading.Lock()
+jobs = {}  # model_id -> job dict (see _new_job)
+
+class PrefetchCancelled(Exception):
+    pass
+
+def init(directory: str):
+    os.makedirs(directory, exist_ok=True)
+    _state["dir"] = directory
+
+def snapshot_dir(model_id: str) -> str:
+    return os.path.join(_state["dir"], model_id.replace("/", "--"))
+
+def local_path(model_id: str):
+    """Directory of a complete snapshot, or None."""
+    path = snapshot_dir(model_id)
+    return path if os.path.exists(os.path.join(path, MANIFEST)) else None
+
+def _hf_cache_repo(model_id: str):
+    """huggingface_hub's cache entry for model_id, or None."""
+    if not HAS_HF_HUB:
+        return None
+    try:
+        repos = scan_cache_dir(HF_CACHE_DIR).repos
+    except Exception:
+        return None  # No cache directory yet, or one scan_cache_dir cannot read
+    return next((r for r in repos if r.repo_type == "model" and r.repo_id == model_id), None)
+
+def _complete_revision(revision) -> bool:
+    """A cached revision has a config and all its weights (every shard listed in an index)."""
+    root = str(revision.snapshot_path)
+    names = {os.path.relpath(str(f.file_path), root).replace(os.sep, "/") for f in revision.files}
+    if "config.json" not in names:
+        return False
+    for index in [n for n in names if n.endswith(".safetensors.index.json")]:
+        with open(os.path.join(root, index)) as f:
+            shards = set(json.load(f).get("weight_map", {}).values())
+        folder = os.path.dirname(index)
+        if any((f"{folder}/{shard}" if folder else shard) not in names for shard in shards):
+            return False
+    return any(n.endswith(".safetensors") for n in names)
+
+def _hf_cache_snapshot(repo):
+    """Snapshot dir of the newest complete revision in a cache entry, or None."""
+    if repo is None:
+        return None
+    for revision in sorted(repo.revisions, key=lambda r: r.last_modified, reverse=True):
+        if _complete_revision(revision):
+            return str(revision.snapshot_path)
+    return None
+
+def hf_cache_path(model_id: str):
+    """Snapshot dir of a complete copy of model_id in the huggingface_hub cache, or None."""
+    return _hf_cache_snapshot(_hf_cache_repo(model_id))
+
+def _store_usage(model_id: str) -> int:
+    total = 0
+    for root, _, files in os.walk(snapshot_dir(model_id)):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def status(model_id: str):
+    """Where a model is installed ("store", "hf_cache" or None) and the bytes both copies use."""
+    repo = _hf_cache_repo(model_id)
+    location = None
+    if local_path(model_id):
+        location = "store"
+    elif _hf_cache_snapshot(repo):
+        location = "hf_cache"
+    return {
+        "downloaded": location is not None,
+        "location": location,
+        "disk_bytes": _store_usage(model_id) + (repo.size_on_disk if repo else 0),
+    }
+
+def is_downloading(model_id: str) -> bool:
+    job = jobs.get(model_id)
+    return bool(job) and job["status"] in ("queued", "downloading")
+
+def _headers():
+    token = os.environ.get("HF_TOKEN")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def _new_job(model_id: str):
+    return {
+        "model": model_id,
+        "status": "queued",  # queued, downloading, complete, error, cancelled
+        "revision": None,  # Commit sha, once resolved
+        "downloaded": 0,
+        "total": 0,
+        "progress": 0.0,
+        "files": {},  # path -> {"size", "downloaded", "status"}
+        "error": None,
+        "started": time.time(),
+        "finished": None,
+        "cancel": threading.Event(),
+    }
+
+def public_job(job):
+    return {k: v for k, v in job.items() if k != "cancel"} if job else None
+
+def resolve_revision(model_id: str) -> str:
+    """Commit sha that REVISION currently points at."""
+    r = requests.get(f"{HF_ENDPOINT}/api/models/{model_id}/revision/{REVISION}", headers=_headers(), timeout=30)
+    r.raise_for_status()
+    return r.json()["sha"]
+
+def list_remote_files(model_id: str, revision: str):
+    """[{"path", "size", "sha256", "oid"}] for every file in the repo at `revision`.
+
+    sha256 is set for LFS files; oid is the git blob id of the file (or of its LFS pointer).
+    """
+    url = f"{HF_ENDPOINT}/api/models/{model_id}/tree/{revision}?recursive=true"
+    files = []
+    while url:
+        r = requests.get(url, headers=_headers(), timeout=30)
+        r.raise_for_status()
+        for entry in r.json():
+            if entry.get("type") == "file":
+                lfs = entry.get("lfs") or {}
+                files.append({
+                    "path": entry["path"],
+                    "size": int(lfs.get("size", entry.get("size", 0))),
+                    "sha256": lfs.get("oid"),
+                    "oid": entry.get("oid"),
+                })
+        # The tree API paginates through a Link: <...>; rel="next" header
+        url = r.links.get("next", {}).get("url")
+    return files
+
+def _hasher(remote):
+    """(hash object, expected hex digest) for a remote file, or (None, None) if it has no hash."""
+    if remote["sha256"]:
+        return hashlib.sha256(), remote["sha256"]
+    if remote["oid"]:
+        h = hashlib.sha1()
+        h.update(f"blob {remote['size']}\0".encode())  # git blob id: sha1 over header and content
+        return h, remote["oid"]
+    return None, None
+
+def _download_file(job, model_id: str, revision: str, remote, dest_dir: str):
+    rel_path, size = remote["path"], remote["size"]
+    entry = job["files"][rel_path]
+    dest = os.path.join(dest_dir, rel_path)
+    part = dest + ".part"
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+    if os.path.exists(dest) and os.path.getsize(dest) == size:
+        h, expected = _hasher(remote)
+        if h:
+            hashing.update_from_file(h, dest)
+        if not h or h.hexdigest() == expected:
+            _advance(job, entry, size - entry["downloaded"])
+            entry["status"] = "complete"
+            return
+        os.remove(dest)  # Right size, wrong content: left over from another revision
+
+    url = f"{HF_ENDPOINT}/{model_id}/resolve/{revision}/{quote(rel_path)}"
+    h, expected = _hasher(remote)
+    hashed = 0  # Bytes of the .part already fed to h
+    attempt = 0
+    while True:
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        if h and hashed != have:
+            # Resuming a .part from an earlier run: hash what is already there
+            h, _ = _hasher(remote)
+            hashing.update_from_file(h, part)
+            hashed = have
+        _advance(job, entry, have - entry["downloaded"])
+        if size and have >= size:
+            break
+        headers = _headers()
+        if have:
+            headers["Range"] = f"bytes={have}-"
+        entry["status"] = "downloading"
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=(10, 60)) as r:
+                r.raise_for_status()
+                if have and r.status_code != 206:
+                    # Server ignored the Range; start the file over
+                    have = 0
+                    _advance(job, entry, -entry["downloaded"])
+                    if h:
+                        h, _ = _hasher(remote)
+                        hashed = 0
+                with open(part, "ab" if have else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        if job["cancel"].is_set():
+                            raise PrefetchCancelled()
+                        f.write(chunk)
+                        if h:
+                            h.update(chunk)
+                            hashed += len(chunk)
+                        _advance(job, entry, len(chunk))
+            if not size:
+                break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise
+            print(f"Prefetch {model_id}/{rel_path} interrupted ({e}); resuming (attempt {attempt})")
+            time.sleep(min(2 ** attempt, 30))
+
+    if size and os.path.getsize(part) != size:
+        raise IOError(f"{rel_path}: expected {size} bytes, got {os.path.getsize(part)}")
+    if h and h.hexdigest() != expected:
+        os.remove(part)
+        raise IOError(f"{rel_path}: checksum mismatch (expected {expected}, got {h.hexdigest()})")
+    os.replace(part, dest)
+    entry["status"] = "complete"
+
+def _pin_revision(dest_dir: str, revision: str):
+    """Record the commit being downloaded, dropping .part files that belong to another one."""
+    marker = os.path.join(dest_dir, REVISION_FILE)
+    previous = None
+    if os.path.exists(marker):
+        with open(marker) as f:
+            previous = f.read().strip()
+    if previous != revision:
+        for root, _, names in os.walk(dest_dir):
+            for name in names:
+                if name.endswith(".part"):
+                    os.remove(os.path.join(root, name))
+        with open(marker, "w") as f:
+            f.write(revision)
+
+def _advance(job, entry, n: int):
+    if not n:
+        return
+    with _lock:
+        entry["downloaded"] += n
+        job["downloaded"] += n
+        job["progress"] = (job["downloaded"] / job["total"] * 100) if job["total"] else 0.0
+
+def _run_job(job, model_id: str):
+    dest_dir = snapshot_dir(model_id)
+    try:
+        revision = resolve_revision(model_id)
+        job["revision"] = revision
+        files = list_remote_files(model_id, revision)
+        job["total"] = sum(f["size"] for f in files)
+        job["files"] = {f["path"]: {"size": f["size"], "downloaded": 0, "status": "queued"} for f in files}
+        job["status"] = "downloading"
+        os.makedirs(dest_dir, exist_ok=True)
+        _pin_revision(dest_dir, revision)
+
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            # Largest first so the long weight files start immediately
+            futures = [pool.submit(_download_file, job, model_id, revision, f, dest_dir)
+                       for f in sorted(files, key=lambda f: -f["size"])]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+                    job["cancel"].set()  # Stop the other workers; .part files are kept for resume
+            cancels = [e for e in errors if isinstance(e, PrefetchCancelled)]
+            real = [e for e in errors if not isinstance(e, PrefetchCancelled)]
+            if real:
+                raise real[0]
+            if cancels:
+                raise cancels[0]
+
+        with open(os.path.join(dest_dir, MANIFEST), "w") as f:
+            json.dump({"model": model_id, "revision": revision,
+                       "files": {item["path"]: item["size"] for item in files},
+                       "completed": time.time()}, f, indent=2)
+        job["status"] = "complete"
+        job["progress"] = 100.0
+        print(f"Prefetch of {model_id} complete ({job['total'] / 1e9:.2f} GB)")
+    except PrefetchCancelled:
+        job["status"] = "cancelled"
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        job["status"] = "error"
+        job["error"] = str(e)
+    finally:
+        job["finished"] = time.time()
+
+def prefetch(model_id: str):
+    """Start (or resume) a background download; returns the job. A running job is reused."""
+    with _lock:
+        if is_downloading(model_id):
+            return jobs[model_id]
+        job = _new_job(model_id)
+        jobs[model_id] = job
+    if local_path(model_id) or hf_cache_path(model_id):
+        job["status"] = "complete"
+        job["progress"] = 100.0
+        job["finished"] = time.time()
+        return job
+    threading.Thread(target=_run_job, args=(job, model_id), daemon=True, name=f"prefetch-{model_id}").start()
+    return job
+
+def delete(model_id: str) -> bool:
+    """Cancel any running download and remove the snapshot (partial files included), along with
+    any copy in the huggingface_hub cache. False when there was nothing to remove."""
+    job = jobs.get(model_id)
+    if job and is_downloading(model_id):
+        job["cancel"].set()
+        # Give the workers a moment to close their files before removing them
+        deadline = time.time() + 10
+        while job["finished"] is None and time.time() < deadline:
+            time.sleep(0.1)
+    jobs.pop(model_id, None)
+    removed = False
+    path = snapshot_dir(model_id)
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+        removed = True
+    repo = _hf_cache_repo(model_id)
+    if repo:
+        shutil.rmtree(repo.repo_path, ignore_errors=True)
+        removed = True
+    return removed
+
+def disk_usage(model_id: str) -> int:
+    """Bytes of model_id on disk, in our store and the huggingface_hub cache together."""
+    return status(model_id)["disk_bytes"]
@@ -0,0 +1,221 @@
+"""
+On-demand request profiling.
+
+A request is traced when it carries an `X-Profile` header or when the admin settings
+(POST /api/profiling) select it: the next N requests, or a random sample. A traced request
+records span timings (queue, model fetch, profile load, inference, encode, ...) and a cProfile
+of the inference thread, optionally with the torch profiler, and writes them to TRACES_DIR:
+
+    <id>.trace.json   Chrome trace of the spans (chrome://tracing, Perfetto)
+    <id>.pstats       cProfile stats (python -m pstats, snakeviz)
+    <id>.torch.json   torch profiler Chrome trace, when requested
+
+Only the newest `keep` traces (set by init) stay on disk; finish() removes older ones.
+
+When nothing is being traced, span() is a single ContextVar lookup returning a shared no-op
+context manager, so the instrumentation costs nothing measurable.
+"""
+import asyncio
+import contextvars
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+_NULL = nullcontext()
+_current = contextvars.ContextVar("profiling_trace", default=None)
+# cProfile can only run in one thread at a time on newer Pythons; extra traces keep spans only
+_cprofile_lock = threading.Lock()
+
+_state = {"dir": None, "keep": 0}
+settings = {
+    "mode": "off",  # off | next | sample
+    "remaining": 0,  # requests left to trace in "next" mode
+    "rate": 0.0,  # fraction of requests to trace in "sample" mode
+    "torch": False,  # also run the torch profiler around inference
+}
+
+_FILE_RE = re.compile(r"^[0-9a-f]{32}\.(trace\.json|pstats|torch\.json)$")
+
+def init(directory: str, keep: int = 0):
+    """Write traces to `directory`, keeping the newest `keep` of them (0 keeps all)."""
+    os.makedirs(directory, exist_ok=True)
+    _state["dir"] = directory
+    _state["keep"] = max(int(keep), 0)
+
+def configure(mode: str, count: int = 1, rate: float = 0.0, torch_profiler: bool = False):
+    if mode not in ("off", "next", "sample"):
+        raise ValueError("mode must be one of: off, next, sample")
+    settings["mode"] = mode
+    settings["remaining"] = max(int(count), 0) if mode == "next" else 0
+    settings["rate"] = min(max(float(rate), 0.0), 1.0) if mode == "sample" else 0.0
+    settings["torch"] = bool(torch_profiler)
+    return dict(settings)
+
+class Trace:
+    def __init__(self, name: str, torch_profiler: bool):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.torch_profiler = torch_profiler
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []  # (name, start, end, thread id), perf_counter seconds
+        self.profile = None
+        self.torch_trace = None
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, start, time.perf_counter(), threading.get_ident()))
+
+def start(name: str, headers=None):
+    """Begin a trace for this request if it asked for one or the admin settings select it."""
+    header = (headers or {}).get("x-profile", "")
+    selected = bool(header) and header != "0"
+    if not selected:
+        mode = settings["mode"]
+        if mode == "off":
+            return None
+        if mode == "next":
+            if settings["remaining"] <= 0:
+                return None
+            settings["remaining"] -= 1
+            if settings["remaining"] == 0:
+                settings["mode"] = "off"
+        elif random.random() >= settings["rate"]:
+            return None
+    trace = Trace(name, torch_profiler=settings["torch"] or header == "torch")
+    _current.set(trace)
+    return trace
+
+def span(name: str):
+    """Time a block under the current request's trace; a no-op when it is not traced."""
+    trace = _current.get()
+    if trace is None:
+        return _NULL
+    return trace.span(name)
+
+async def to_thread(name: str, func, *args, profile_call: bool = False, **kwargs):
+    """asyncio.to_thread with a "queue" span (waiting for a worker thread) and a `name` span.
+
+    With profile_call the call runs under cProfile, and the torch profiler if the trace asked
+    for it. Without a current trace this is exactly asyncio.to_thread(func, ...).
+    """
+    trace = _current.get()
+    if trace is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    submitted = time.perf_counter()
+
+    def _run():
+        trace.spans.append(("queue", submitted, time.perf_counter(), threading.get_ident()))
+        with trace.span(name):
+            if not profile_call:
+                return func(*args, **kwargs)
+            return _call_profiled(trace, func, args, kwargs)
+
+    return await asyncio.to_thread(_run)
+
+def _call_profiled(trace: Trace, func, args, kwargs):
+    torch_prof = None
+    if trace.torch_profiler:
+        try:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_prof = torch.profiler.profile(activities=activities, record_shapes=True)
+        except Exception as e:
+            print(f"torch profiler unavailable: {e}")
+
+    profile = None
+    if _cprofile_lock.acquire(blocking=False):
+        profile = cProfile.Profile()
+    try:
+        if torch_prof is not None:
+            torch_prof.__enter__()
+        if profile is not None:
+            profile.enable()
+        return func(*args, **kwargs)
+    finally:
+        if profile is not None:
+            profile.disable()
+            _cprofile_lock.release()
+            trace.profile = profile
+        if torch_prof is not None:
+            torch_prof.__exit__(None, None, None)
+            trace.torch_trace = torch_prof
+
+async def finish(trace: Trace):
+    """Write the trace files in a worker thread and return a summary of span durations in ms."""
+    _current.set(None)
+    return await asyncio.to_thread(_write, trace)
+
+def _write(trace: Trace):
+    pid = os.getpid()
+    events = [{
+        "name": name,
+        "cat": trace.name,
+        "ph": "X",
+        "ts": (start - trace.origin) * 1e6,
+        "dur": (end - start) * 1e6,
+        "pid": pid,
+        "tid": tid,
+    } for name, start, end, tid in trace.spans]
+    with open(os.path.join(_state["dir"], f"{trace.id}.trace.json"), "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "metadata": {"request": trace.name, "started_at": trace.started_at}}, f)
+
+    files = [f"{trace.id}.trace.json"]
+    if trace.profile is not None:
+        trace.profile.dump_stats(os.path.join(_state["dir"], f"{trace.id}.pstats"))
+        files.append(f"{trace.id}.pstats")
+    if trace.torch_trace is not None:
+        trace.torch_trace.export_chrome_trace(os.path.join(_state["dir"], f"{trace.id}.torch.json"))
+        files.append(f"{trace.id}.torch.json")
+    prune()
+
+    spans = {}
+    for name, start, end, _ in trace.spans:
+        spans[name] = spans.get(name, 0.0) + (end - start) * 1000
+    return {"id": trace.id, "request": trace.name, "spans": spans, "files": files}
+
+def server_timing(summary) -> str:
+    """Span durations as a Server-Timing header value (shown in browser devtools)."""
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in summary["spans"].items())
+
+def list_traces():
+    traces = {}
+    for name in sorted(os.listdir(_state["dir"])):
+        if not _FILE_RE.match(name):
+            continue
+        path = os.path.join(_state["dir"], name)
+        entry = traces.setdefault(name[:32], {"id": name[:32], "created": os.path.getmtime(path), "files": []})
+        entry["files"].append(name)
+    return sorted(traces.values(), key=lambda t: t["created"], reverse=True)
+
+def prune():
+    """Delete all but the newest `keep` traces."""
+    if not _state["keep"]:
+        return
+    for old in list_traces()[_state["keep"]:]:
+        for name in old["files"]:
+            try:
+                os.remove(os.path.join(_state["dir"], name))
+            except FileNotFoundError:
+                pass  # Removed by a concurrent prune
+
+def trace_path(filename: str):
+    """Path of a downloadable trace file, or None for anything that is not one."""
+    if not _FILE_RE.match(filename or ""):
+        return None
+    path = os.path.join(_state["dir"], filename)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,79 @@
+"""
+Bounded cache of voice conditioning computed by the loaded model.
+
+Building a voice-clone prompt runs the speaker encoder and the speech tokenizer over the
+reference clip, which is the same work for every paragraph read in the same voice. Prompts
+are computed once per (model, voice, reference text) and shared by /api/generate and every
+editing session, in an LRU bounded by the bytes of the tensors it holds
+(PROMPT_CACHE_BYTES). The tensors live on the model's device, so main._unload_model clears
+the cache along with the model.
+
+Only Base voice-clone prompts are cached. The speaker/instruct prefix of CustomVoice and
+VoiceDesign is still prefilled on every call: qwen_tts's generate() builds its input embeddings
+internally and accepts no past_key_values, so a prefix KV cache cannot be passed in.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PROMPT_CACHE_BYTES = int(float(os.environ.get("TTS_PROMPT_CACHE_MB", 256)) * 1024 * 1024)
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # key -> {"value", "bytes", "hits", "created"}
+_state = {"bytes": 0, "hits": 0, "misses": 0}
+
+def nbytes(value) -> int:
+    """Bytes held by the tensors/arrays inside a (nested) prompt value."""
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    if hasattr(value, "nbytes") and not isinstance(value, (bytes, bytearray)):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    if hasattr(value, "__dict__"):
+        return sum(nbytes(v) for v in vars(value).values())
+    return 0
+
+def get_or_create(key, factory):
+    """Cached value for key, or factory()'s result (cached if it fits the budget).
+
+    factory runs outside the lock; two threads missing the same key both compute it and
+    the later result wins, which is harmless for deterministic prompts.
+    """
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            entry["hits"] += 1
+            _state["hits"] += 1
+            return entry["value"]
+        _state["misses"] += 1
+
+    value = factory()
+    size = nbytes(value)
+    with _lock:
+        _drop(key)
+        if size <= PROMPT_CACHE_BYTES:
+            _cache[key] = {"value": value, "bytes": size, "hits": 0, "created": time.time()}
+            _state["bytes"] += size
+            while _state["bytes"] > PROMPT_CACHE_BYTES:
+                _drop(next(iter(_cache)))
+    return value
+
+def _drop(key):
+    entry = _cache.pop(key, None)
+    if entry:
+        _state["bytes"] -= entry["bytes"]
+
+def clear():
+    with _lock:
+        _cache.clear()
+        _state["bytes"] = 0
+
+def stats():
+    with _lock:
+        return {"entries": len(_cache), "bytes": _state["bytes"], "max_bytes": PROMPT_CACHE_BYTES,
+                "hits": _state["hits"], "misses": _state["misses"]}
@@ -0,0 +1,416 @@
+"""
+Model-affinity router for running several Local TTS Studio server instances behind one port.
+
+Each backend is a normal `main:app` uvicorn process. /api/generate requests are routed by
+model id on a consistent-hash ring so every backend keeps its own models hot instead of
+swapping on every request. Backends are health-checked through /api/health; requests queue
+at the backends that have the model, and spill over to another backend only when the
+preferred one is down or its queue reaches --spill-queue.
+
+All backends share one profile store (TTS_DATA_DIR), and profile writes are pinned to a
+single backend so profiles.json is never written by two processes at once. Editing sessions
+(/api/session WebSockets) are proxied to the backend picked for the model in their first
+configure message and stay there for the life of the connection.
+
+Usage:
+    python router.py --backends 8101,8102,8103 --port 8001
+    python router.py --spawn 3 --port 8001            # start the backends as well
+    python router.py --spawn 3 --port 8001 --stub     # stub models, no Qwen download
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import requests
+import uvicorn
+import websockets
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+HEALTH_INTERVAL = 2.0  # Seconds between backend health checks
+HEALTH_TIMEOUT = 2.0
+VIRTUAL_NODES = 64  # Ring points per backend, keeps the key spread even with few backends
+
+# Hop-by-hop headers that must not be copied between the client and backend connections
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "host",
+               "proxy-authenticate", "proxy-authorization", "te", "trailers", "upgrade"}
+# Request bodies are re-framed by requests (its own Content-Length, or chunked), so the
+# client's length is dropped; responses are relayed byte for byte and keep theirs.
+REQUEST_SKIP_HEADERS = HOP_HEADERS | {"content-length"}
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+class HashRing:
+    """Consistent-hash ring; adding or removing a backend only moves that backend's keys."""
+
+    def __init__(self, nodes, vnodes: int = VIRTUAL_NODES):
+        self.nodes = list(nodes)
+        self._points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [p[0] for p in self._points]
+
+    def candidates(self, key: str):
+        """All nodes in ring order starting from the owner of `key`."""
+        if not self._points:
+            return []
+        start = bisect.bisect(self._keys, _hash(key)) % len(self._points)
+        ordered = []
+        for i in range(len(self._points)):
+            node = self._points[(start + i) % len(self._points)][1]
+            if node not in ordered:
+                ordered.append(node)
+                if len(ordered) == len(self.nodes):
+                    break
+        return ordered
+
+# Router state, filled in by configure()
+backends = {}  # url -> {"healthy", "active", "inflight", "model", "last_check", "error"}
+ring = HashRing([])
+settings = {"max_active": 1, "replicas": 1, "spill_queue": 4}
+
+def configure(urls, max_active: int = 1, replicas: int = 1, spill_queue: int = 4):
+    global ring
+    backends.clear()
+    for url in urls:
+        backends[url] = {"healthy": False, "active": 0, "inflight": 0, "model": None,
+                         "last_check": 0.0, "error": None}
+    ring = HashRing(urls)
+    settings["max_active"] = max(1, max_active)
+    settings["replicas"] = max(1, min(replicas, len(urls)))
+    settings["spill_queue"] = max(1, spill_queue)
+
+def _load(url: str) -> int:
+    # The backend's own counter lags by up to one health interval; our in-flight count does not.
+    b = backends[url]
+    return max(b["active"], b["inflight"])
+
+def _queued(url: str) -> int:
+    """How many requests a new one would wait behind at a backend (0 while under --max-active)."""
+    return max(0, _load(url) - settings["max_active"] + 1)
+
+def pick_backends(model_id: str, affinity_key: str = ""):
+    """Backends to try for a request, best first.
+
+    The model id picks the owner on the ring. With --replicas > 1 the model is spread over
+    that many consecutive ring nodes and `affinity_key` (profile or speaker) picks among them,
+    so one voice keeps landing on the same replica. The model's home is those owners plus any
+    backend that already reports the model loaded; requests queue there, least loaded and
+    already-loaded first, because sending one elsewhere makes that backend evict its own model.
+    Only when every home backend has --spill-queue requests waiting does the request spill to
+    a backend that has to swap (idle ones first). Unhealthy backends come last.
+    """
+    ordered = ring.candidates(model_id)
+    replicas = settings["replicas"]
+    if replicas > 1 and affinity_key:
+        group = ordered[:replicas]
+        shift = _hash(affinity_key) % len(group)
+        ordered = group[shift:] + group[:shift] + ordered[replicas:]
+
+    healthy = [u for u in ordered if backends[u]["healthy"]]
+    owners = set(ordered[:replicas])
+    home = sorted((u for u in healthy if u in owners or backends[u]["model"] == model_id),
+                  key=lambda u: (_queued(u), backends[u]["model"] != model_id))
+    others = [u for u in healthy if u not in home]
+    idle = [u for u in others if _load(u) < settings["max_active"]]
+    busy = sorted((u for u in others if u not in idle), key=_load)
+    down = [u for u in ordered if not backends[u]["healthy"]]
+    if home and _queued(home[0]) < settings["spill_queue"]:
+        return home + idle + busy + down
+    return idle + home + busy + down
+
+def least_loaded():
+    """Every backend, healthy and least loaded first (for requests with no model affinity)."""
+    return sorted(backends, key=lambda u: (not backends[u]["healthy"], _load(u)))
+
+def primary_backend():
+    """Backend that owns profile writes: the first healthy one in configuration order."""
+    for url, b in backends.items():
+        if b["healthy"]:
+            return url
+    return next(iter(backends), None)
+
+def _check_backend(url: str):
+    b = backends[url]
+    try:
+        r = requests.get(f"{url}/api/health", timeout=HEALTH_TIMEOUT)
+        r.raise_for_status()
+        data = r.json()
+        b["healthy"] = True
+        b["active"] = int(data.get("active", 0))
+        b["model"] = data.get("model")
+        b["error"] = None
+    except Exception as e:
+        if b["healthy"]:
+            print(f"Backend {url} is unhealthy: {e}")
+        b["healthy"] = False
+        b["error"] = str(e)
+    b["last_check"] = time.time()
+
+async def _health_loop():
+    while True:
+        await asyncio.gather(*(asyncio.to_thread(_check_backend, url) for url in list(backends)))
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.create_task(_health_loop())
+    yield
+    task.cancel()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/api/router/status")
+def router_status():
+    return {
+        "backends": backends,
+        "max_active": settings["max_active"],
+        "replicas": settings["replicas"],
+        "spill_queue": settings["spill_queue"],
+    }
+
+def _forward_headers(request: Request):
+    return {k: v for k, v in request.headers.items() if k.lower() not in REQUEST_SKIP_HEADERS}
+
+class _StreamedBody:
+    """File-like view of the client's request body, read by requests on its worker thread.
+
+    Each read pulls the next chunk from the ASGI receive stream on the event loop, so uploads
+    (merges can be GBs) pass through the router without being held in memory. The declared
+    Content-Length, if any, is forwarded; otherwise the body goes out chunked.
+    """
+
+    def __init__(self, request: Request, loop):
+        self._chunks = request.stream()
+        self._loop = loop
+        self.started = False
+        length = request.headers.get("content-length", "")
+        if length.isdigit():
+            self.len = int(length)
+
+    def read(self, size: int = -1) -> bytes:
+        self.started = True
+        while True:
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(self._chunks.__anext__(), self._loop).result()
+            except StopAsyncIteration:
+                return b""
+            if chunk:
+                return chunk
+
+    def __iter__(self):
+        while chunk := self.read():
+            yield chunk
+
+def _has_body(request: Request) -> bool:
+    if request.method in ("GET", "HEAD"):
+        return False
+    return request.headers.get("content-length") != "0"
+
+async def _proxy(request: Request, targets, body=None):
+    """Send the request to the first target that accepts a connection and stream the reply back.
+
+    `body` is the already-read body; without one the client's body is streamed through.
+    """
+    path = request.url.path
+    if request.url.query:
+        path += "?" + request.url.query
+    headers = _forward_headers(request)
+    if body is None and _has_body(request):
+        body = _StreamedBody(request, asyncio.get_running_loop())
+
+    last_error = None
+    for url in targets:
+        b = backends[url]
+        b["inflight"] += 1
+        try:
+            r = await asyncio.to_thread(
+                requests.request, request.method, url + path,
+                data=body, headers=headers, stream=True, timeout=(HEALTH_TIMEOUT, None),
+            )
+        except requests.exceptions.ConnectionError as e:
+            # Backend died since the last health check; mark it and spill to the next one
+            b["inflight"] -= 1
+            b["healthy"] = False
+            b["error"] = str(e)
+            last_error = e
+            if isinstance(body, _StreamedBody) and body.started:
+                # Part of a streamed body is gone, so it cannot be replayed to another backend
+                raise HTTPException(status_code=502, detail=f"Backend failed during upload: {e}")
+            continue
+
+        def _done(resp=r, backend=b):
+            resp.close()
+            backend["inflight"] -= 1
+
+        out_headers = {k: v for k, v in r.headers.items() if k.lower() not in HOP_HEADERS}
+        out_headers["X-Backend"] = url
+        return StreamingResponse(
+            r.raw.stream(65536, decode_content=False),
+            status_code=r.status_code,
+            headers=out_headers,
+            background=BackgroundTask(_done),
+        )
+
+    raise HTTPException(status_code=503, detail=f"No backend available: {last_error}")
+
+@app.post("/api/generate")
+async def route_generate(request: Request):
+    # Cache the raw body first so it can be both parsed for routing and forwarded untouched
+    body = await request.body()
+    form = await request.form()
+    model_size = form.get("model_size", "1.7B")
+    model_type = form.get("model_type", "CustomVoice")
+    model_id = f"Qwen/Qwen3-TTS-12Hz-{model_size}-{model_type}"
+    affinity = form.get("profile_id") or form.get("speaker") or form.get("voice_design_prompt") or ""
+    return await _proxy(request, pick_backends(model_id, str(affinity)), body)
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "DELETE", "PUT", "PATCH"])
+async def route_other(path: str, request: Request):
+    if path.startswith("api/profiles") and request.method != "GET":
+        primary = primary_backend()
+        targets = [primary] if primary else []
+    else:
+        targets = least_loaded()
+    return await _proxy(request, targets)
+
+def _session_targets(first_message):
+    """Backends for a session, from its first message when that is a configure."""
+    try:
+        msg = json.loads(first_message)
+    except ValueError:
+        msg = None  # The backend answers bad JSON itself
+    if not isinstance(msg, dict) or msg.get("type") != "configure":
+        return least_loaded()
+    model_id = f"Qwen/Qwen3-TTS-12Hz-{msg.get('model_size', '1.7B')}-{msg.get('model_type', 'CustomVoice')}"
+    affinity = msg.get("profile_id") or msg.get("speaker") or msg.get("voice_design_prompt") or ""
+    return pick_backends(model_id, str(affinity))
+
+# Either side of a relayed session going away; the relay just stops
+_SESSION_CLOSED = (websockets.ConnectionClosed, WebSocketDisconnect, RuntimeError)
+
+async def _pump_to_backend(websocket: WebSocket, upstream):
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            await upstream.send(message["text"] if message.get("text") is not None else message["bytes"])
+    except _SESSION_CLOSED:
+        pass
+
+async def _pump_to_client(websocket: WebSocket, upstream):
+    try:
+        async for message in upstream:
+            if isinstance(message, str):
+                await websocket.send_text(message)
+            else:
+                await websocket.send_bytes(message)
+    except _SESSION_CLOSED:
+        pass
+
+@app.websocket("/api/session")
+async def route_session(websocket: WebSocket):
+    """Relay an editing session to one backend. The backend is picked like /api/generate from
+    the session's first message (the UI always opens with configure); a later configure for
+    another model stays on that backend."""
+    await websocket.accept()
+    first = await websocket.receive()
+    if first["type"] == "websocket.disconnect":
+        return
+    first = first["text"] if first.get("text") is not None else first["bytes"]
+
+    upstream = None
+    for url in _session_targets(first):
+        try:
+            upstream = await websockets.connect("ws" + url[len("http"):] + "/api/session",
+                                                max_size=None, open_timeout=HEALTH_TIMEOUT)
+            break
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+            backends[url]["healthy"] = False
+            backends[url]["error"] = str(e)
+    if upstream is None:
+        await websocket.close(code=1013)  # Try again later
+        return
+
+    pumps = [asyncio.create_task(_pump_to_backend(websocket, upstream)),
+             asyncio.create_task(_pump_to_client(websocket, upstream))]
+    try:
+        await upstream.send(first)
+        # Either side closing ends the session for both
+        await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pumps:
+            task.cancel()
+        await upstream.close()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # The client already went away
+
+def spawn_backends(count: int, base_port: int, stub: bool):
+    """Start `count` uvicorn instances of main:app on consecutive ports."""
+    env = dict(os.environ)
+    env.setdefault("TTS_DATA_DIR", os.path.abspath("data"))
+    if stub:
+        env["TTS_STUB_MODEL"] = "1"
+    procs = []
+    for i in range(count):
+        port = base_port + i
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+        ))
+    return procs
+
+def main():
+    parser = argparse.ArgumentParser(description="Model-affinity router for Local TTS Studio backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--backends", default="", help="Comma-separated backend ports or URLs")
+    parser.add_argument("--spawn", type=int, default=0, help="Start this many backends locally")
+    parser.add_argument("--backend-base-port", type=int, default=8101)
+    parser.add_argument("--stub", action="store_true", help="Spawned backends use stub models")
+    parser.add_argument("--max-active", type=int, default=1,
+                        help="Concurrent generations per backend before spilling over")
+    parser.add_argument("--replicas", type=int, default=1,
+                        help="Backends per model; profiles are spread across them")
+    parser.add_argument("--spill-queue", type=int, default=4,
+                        help="Requests waiting at a model's backends before one that has to "
+                             "swap models takes the next")
+    args = parser.parse_args()
+
+    procs = []
+    urls = []
+    if args.spawn:
+        procs = spawn_backends(args.spawn, args.backend_base_port, args.stub)
+        urls = [f"http://127.0.0.1:{args.backend_base_port + i}" for i in range(args.spawn)]
+    for item in filter(None, (x.strip() for x in args.backends.split(","))):
+        urls.append(item if item.startswith("http") else f"http://127.0.0.1:{item}")
+    if not urls:
+        parser.error("Give --backends or --spawn")
+
+    configure(urls, max_active=args.max_active, replicas=args.replicas, spill_queue=args.spill_queue)
+    print(f"Routing {args.host}:{args.port} -> {', '.join(urls)}")
+    # uvicorn re-raises SIGTERM after shutting down; turn it into SystemExit so the spawned
+    # backends below are still stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Sentence-level audio reuse for paragraph edits.
+
+Paragraphs generated with a paragraph id are synthesized one sentence per batch item, and the
+sentence texts and their audio are remembered per paragraph. When the paragraph is generated
+again with the same voice, its old and new sentence lists are diffed and only sentences that
+changed are synthesized; the rest of the audio is reused and spliced back together with
+short crossfades. Editing one word of a long paragraph then costs one sentence of inference.
+
+The map is an in-process LRU bounded by the bytes of audio it holds (SENTENCE_CACHE_BYTES).
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+SENTENCE_CACHE_BYTES = int(float(os.environ.get("TTS_SENTENCE_CACHE_MB", 256)) * 1024 * 1024)
+CROSSFADE_SECONDS = 0.01
+# Latin fragments shorter than this ("Dr.", "No.") are joined to the following sentence; the
+# model reads very short inputs poorly. CJK sentences are dense enough to stand alone.
+MIN_SENTENCE_CHARS = 12
+
+# Latin terminators only end a sentence before whitespace (so "3.5" or "e.g.x" do not split);
+# CJK full-width terminators end one outright. Closing quotes and brackets stay with the sentence.
+_BOUNDARY_RE = re.compile(r"[.!?…]+[\"'”’)\]]*(?=\s|$)|[。！？]+[\"'”’」』)\]]*")
+_CJK_END_RE = re.compile(r"[。！？][\"'”’」』)\]]*$")
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # paragraph_id -> {"fingerprint", "sentences", "segments", "sr", "bytes"}
+_state = {"bytes": 0}
+
+def split_sentences(text: str):
+    pieces = []
+    start = 0
+    for m in _BOUNDARY_RE.finditer(text):
+        pieces.append(text[start:m.end()].strip())
+        start = m.end()
+    pieces.append(text[start:].strip())
+
+    sentences = []
+    carry = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        piece = f"{carry} {piece}" if carry else piece
+        if len(piece) < MIN_SENTENCE_CHARS and not _CJK_END_RE.search(piece):
+            carry = piece
+        else:
+            sentences.append(piece)
+            carry = ""
+    if carry:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {carry}"
+        else:
+            sentences.append(carry)
+    return sentences or [text.strip()]
+
+def fingerprint(**voice) -> str:
+    """Stable hash of everything besides the text that shapes the audio (model, voice, sampling)."""
+    return hashlib.sha1(json.dumps(voice, sort_keys=True, default=str).encode()).hexdigest()
+
+def plan(old_sentences, new_sentences):
+    """For each new sentence, the index of an identical old sentence to reuse, or None."""
+    reuse = [None] * len(new_sentences)
+    matcher = difflib.SequenceMatcher(a=old_sentences, b=new_sentences, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                reuse[j1 + k] = i1 + k
+    return reuse
+
+def splice(segments, sr: int, crossfade: float = CROSSFADE_SECONDS):
+    """Join mono segments, overlapping each boundary by a linear crossfade."""
+    segments = [np.asarray(s, dtype=np.float32) for s in segments if len(s)]
+    if not segments:
+        return np.zeros(0, dtype=np.float32)
+    fade = int(sr * crossfade)
+    overlaps = [min(fade, len(a), len(b)) for a, b in zip(segments, segments[1:])]
+    out = np.empty(sum(len(s) for s in segments) - sum(overlaps), dtype=np.float32)
+
+    pos = len(segments[0])
+    out[:pos] = segments[0]
+    for seg, n in zip(segments[1:], overlaps):
+        if n:
+            ramp = np.linspace(0.0, 1.0, n, endpoint=False, dtype=np.float32)
+            out[pos - n:pos] = out[pos - n:pos] * (1.0 - ramp) + seg[:n] * ramp
+        out[pos:pos + len(seg) - n] = seg[n:]
+        pos += len(seg) - n
+    return out
+
+def lookup(paragraph_id: str, voice_fingerprint: str):
+    """Cached sentences for a paragraph generated with the same voice, or None."""
+    with _lock:
+        entry = _cache.get(paragraph_id)
+        if entry is None or entry["fingerprint"] != voice_fingerprint:
+            return None
+        _cache.move_to_end(paragraph_id)
+        return entry
+
+def remember(paragraph_id: str, voice_fingerprint: str, sentences, segments, sr: int):
+    size = sum(s.nbytes for s in segments)
+    with _lock:
+        _drop(paragraph_id)
+        if size > SENTENCE_CACHE_BYTES:
+            return
+        _cache[paragraph_id] = {"fingerprint": voice_fingerprint, "sentences": list(sentences),
+                                "segments": list(segments), "sr": sr, "bytes": size}
+        _state["bytes"] += size
+        while _state["bytes"] > SENTENCE_CACHE_BYTES:
+            _drop(next(iter(_cache)))
+
+def _drop(paragraph_id: str):
+    entry = _cache.pop(paragraph_id, None)
+    if entry:
+        _state["bytes"] -= entry["bytes"]
+
+def stats():
+    with _lock:
+        return {"paragraphs": len(_cache), "bytes": _state["bytes"], "max_bytes": SENTENCE_CACHE_BYTES}
@@ -18,6 +18,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const updateVersionSpan = document.getElementById('update-version');
     const btnDoUpdate = document.getElementById('btn-do-update');
     let otaDownloadUrl = null;
+    let otaManifestUrl = null;
+    let otaSha256 = null;
 
     const downloadOptions = document.getElementById('download-options');
 
@@ -63,6 +65,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = await res.json();
             if (data.update_available && data.download_url) {
                 otaDownloadUrl = data.download_url;
+                otaManifestUrl = data.manifest_url;
+                otaSha256 = data.sha256;
                 updateVersionSpan.textContent = data.latest_version;
                 updateBanner.classList.remove('hidden');
             }
@@ -81,6 +85,8 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const formData = new FormData();
             formData.append("download_url", otaDownloadUrl);
+            if (otaManifestUrl) formData.append("manifest_url", otaManifestUrl);
+            if (otaSha256) formData.append("sha256", otaSha256);
             const res = await fetch('/api/do_update', {
                 method: 'POST',
                 body: formData
@@ -147,6 +153,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         text = cleanText(text);
 
+        // Drop any queued session work for the previous set of paragraphs
+        paragraphsData.forEach(p => editSession.remove(p.id));
+
         // Split by newlines, filter empty
         const rawParagraphs = text.split(/\n+/).map(p => p.trim()).filter(p => p.length > 0);
 
@@ -154,7 +163,7 @@ document.addEventListener('DOMContentLoaded', () => {
             id: `para-${index}`,
             text: text,
             status: 'idle',
-            audioBlob: null,
+            artifactId: null,
             audioUrl: null
         }));
 
@@ -226,54 +235,157 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // Voice settings sent with every generation (once per session over the WebSocket)
+    function getVoiceConfig() {
+        const config = {
+            language: "English",
+            model_size: "1.7B",
+            model_type: modelTypeSelect.value
+        };
+        if (modelTypeSelect.value === 'CustomVoice') {
+            config.speaker = speakerSelect.value;
+        } else if (modelTypeSelect.value === 'VoiceDesign') {
+            config.voice_design_prompt = voiceDesignPrompt.value;
+        } else if (modelTypeSelect.value === 'Base') {
+            if (!savedVoiceSelect.value) return null;
+            config.profile_id = savedVoiceSelect.value;
+        }
+        return config;
+    }
+
+    async function generateViaPost(text, config, paragraphId, fresh) {
+        const formData = new FormData();
+        formData.append("text", text);
+        // Lets the server re-synthesize only the sentences that changed since the last take
+        formData.append("paragraph_id", paragraphId);
+        if (fresh) formData.append("fresh", "true");
+        formData.append("return_artifact", "true");
+        Object.entries(config).forEach(([key, value]) => formData.append(key, value));
+
+        const response = await fetch('/api/generate', {
+            method: 'POST',
+            body: formData
+        });
+
+        if (!response.ok) {
+            throw new Error('API returned ' + response.status);
+        }
+        return await response.json();
+    }
+
+    // --- Editing Session ---
+    // One WebSocket carries the voice settings once and then only paragraph edits.
+    // The server coalesces rapid edits to the same paragraph, so a paragraph's promise
+    // resolves with the artifact for its latest text. Falls back to POST if the socket fails.
+    const editSession = (() => {
+        let ws = null;
+        let opening = null;
+        let unavailable = false;
+        let sentConfig = null;
+        const waiters = new Map(); // paragraph_id -> [{resolve, reject}]
+
+        function settle(paragraphId, fn) {
+            const list = waiters.get(paragraphId) || [];
+            waiters.delete(paragraphId);
+            list.forEach(fn);
+        }
+
+        function failAll(message) {
+            Array.from(waiters.keys()).forEach(id => settle(id, w => w.reject(new Error(message))));
+        }
+
+        function open() {
+            if (ws && ws.readyState === WebSocket.OPEN) return Promise.resolve(ws);
+            if (opening) return opening;
+            opening = new Promise((resolve) => {
+                const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
+                const socket = new WebSocket(`${proto}://${window.location.host}/api/session`);
+                socket.onopen = () => { ws = socket; opening = null; resolve(socket); };
+                socket.onerror = () => {
+                    if (!ws) { unavailable = true; opening = null; resolve(null); }
+                };
+                socket.onclose = () => {
+                    ws = null;
+                    sentConfig = null;
+                    failAll('Session closed');
+                };
+                socket.onmessage = (event) => {
+                    // Sessions are configured artifacts_only, so there are no binary frames
+                    if (typeof event.data !== 'string') return;
+                    const msg = JSON.parse(event.data);
+                    if (msg.type === 'audio') {
+                        settle(msg.paragraph_id, w => w.resolve(msg.artifact));
+                    } else if (msg.type === 'error') {
+                        if (msg.paragraph_id) {
+                            settle(msg.paragraph_id, w => w.reject(new Error(msg.detail)));
+                        } else {
+                            // A failed configure invalidates everything queued behind it
+                            sentConfig = null;
+                            failAll(msg.detail);
+                        }
+                    }
+                };
+            });
+            return opening;
+        }
+
+        return {
+            async isAvailable() {
+                if (unavailable || !('WebSocket' in window)) return false;
+                return (await open()) !== null;
+            },
+            async generate(paragraphId, text, config, fresh) {
+                const socket = await open();
+                if (!socket) throw new Error('Session unavailable');
+                const configJson = JSON.stringify(config);
+                if (configJson !== sentConfig) {
+                    socket.send(JSON.stringify({ type: 'configure', artifacts_only: true, ...config }));
+                    sentConfig = configJson;
+                }
+                const result = new Promise((resolve, reject) => {
+                    if (!waiters.has(paragraphId)) waiters.set(paragraphId, []);
+                    waiters.get(paragraphId).push({ resolve, reject });
+                });
+                socket.send(JSON.stringify({ type: 'upsert', paragraph_id: paragraphId, text: text, fresh: !!fresh }));
+                return result;
+            },
+            remove(paragraphId) {
+                if (ws && ws.readyState === WebSocket.OPEN) {
+                    ws.send(JSON.stringify({ type: 'delete', paragraph_id: paragraphId }));
+                }
+                settle(paragraphId, w => w.reject(new Error('Paragraph removed')));
+            }
+        };
+    })();
+
     // Expose to window for the inline onclick handlers
     window.generateSingle = async (index) => {
         const para = paragraphsData[index];
         if (para.status === 'generating') return;
+        // Regenerating an unedited paragraph is a request for a new take, not a cache hit
+        const fresh = para.status === 'done';
 
         para.status = 'generating';
-        if (para.audioUrl) URL.revokeObjectURL(para.audioUrl);
-        para.audioBlob = null;
+        para.artifactId = null;
         para.audioUrl = null;
         updateCardUi(index);
         log(`Generating para ${index + 1}...`);
 
-        try {
-            const formData = new FormData();
-            formData.append("text", para.text);
-            formData.append("language", "English");
-            formData.append("model_size", "1.7B");
-            formData.append("model_type", modelTypeSelect.value);
-
-            if (modelTypeSelect.value === 'CustomVoice') {
-                formData.append("speaker", speakerSelect.value);
-            } else if (modelTypeSelect.value === 'VoiceDesign') {
-                formData.append("voice_design_prompt", voiceDesignPrompt.value);
-            } else if (modelTypeSelect.value === 'Base') {
-                if (!savedVoiceSelect.value) {
-                    alert("Please select a saved voice profile first.");
-                    para.status = 'idle';
-                    updateCardUi(index);
-                    return;
-                }
-                formData.append("profile_id", savedVoiceSelect.value);
-            }
-
-            const response = await fetch('/api/generate', {
-                method: 'POST',
-                body: formData
-            });
-
-            if (!response.ok) {
-                throw new Error('API returned ' + response.status);
-            }
-
-            const blob = await response.blob();
-            para.audioBlob = blob;
-
-            if (para.audioUrl) URL.revokeObjectURL(para.audioUrl);
+        const config = getVoiceConfig();
+        if (!config) {
+            alert("Please select a saved voice profile first.");
+            para.status = 'idle';
+            updateCardUi(index);
+            return;
+        }
 
-            para.audioUrl = URL.createObjectURL(blob);
+        try {
+            // Audio stays on the server; the player streams it by artifact id
+            const artifact = (await editSession.isAvailable())
+                ? await editSession.generate(para.id, para.text, config, fresh)
+                : await generateViaPost(para.text, config, para.id, fresh);
+            para.artifactId = artifact.id;
+            para.audioUrl = `/api/artifacts/${artifact.id}`;
             para.status = 'done';
             log(`Para ${index + 1} ready.`, 'ok');
 
@@ -348,11 +460,11 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     btnDownloadAll.addEventListener('click', async () => {
-        const blobsToMerge = paragraphsData
-            .filter(p => p.status === 'done' && p.audioBlob != null)
-            .map(p => p.audioBlob);
+        const artifactIds = paragraphsData
+            .filter(p => p.status === 'done' && p.artifactId != null)
+            .map(p => p.artifactId);
 
-        if (blobsToMerge.length === 0) {
+        if (artifactIds.length === 0) {
             alert("No audio generated yet!");
             return;
         }
@@ -362,11 +474,13 @@ document.addEventListener('DOMContentLoaded', () => {
         btnDownloadAll.textContent = 'Processing...';
 
         try {
+            // Segments are merged and treated server-side by artifact id; no audio is uploaded
             log('Merging segments...');
             const formData = new FormData();
-            blobsToMerge.forEach((blob, idx) => {
-                formData.append('files', blob, `segment_${idx}.wav`);
-            });
+            formData.append('artifact_ids', JSON.stringify(artifactIds));
+            // Normalize loudness during the merge from the segments' stored measurements,
+            // so the treatment below only has to apply its EQ
+            formData.append('normalize_for', 'clear');
 
             const mergeResponse = await fetch('/api/merge', {
                 method: 'POST',
@@ -377,14 +491,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error('Merge API failed: ' + mergeResponse.status);
             }
 
-            let finalBlob = await mergeResponse.blob();
+            let finalArtifact = await mergeResponse.json();
             log('Merge complete.', 'ok');
 
             // Always apply Clear Speech treatment
             log('Applying treatment...');
             btnDownloadAll.textContent = 'Applying Treatment...';
             const treatFormData = new FormData();
-            treatFormData.append("audio_file", finalBlob, "merged.wav");
+            treatFormData.append("artifact_id", finalArtifact.id);
             treatFormData.append("treatment_type", "clear");
 
             const treatResponse = await fetch('/api/treat', {
@@ -393,7 +507,7 @@ document.addEventListener('DOMContentLoaded', () => {
             });
 
             if (treatResponse.ok) {
-                finalBlob = await treatResponse.blob();
+                finalArtifact = await treatResponse.json();
                 log('Treatment applied.', 'ok');
             } else {
                 log('Treatment failed. Using raw audio.', 'warn');
@@ -403,14 +517,12 @@ document.addEventListener('DOMContentLoaded', () => {
             // sanitize the filename
             const safeTitle = customTitle.replace(/[^a-z0-9_ -]/gi, '_').replace(/\s+/g, '_');
 
-            const downloadUrl = URL.createObjectURL(finalBlob);
             const a = document.createElement('a');
-            a.href = downloadUrl;
+            a.href = `/api/artifacts/${finalArtifact.id}?filename=${encodeURIComponent(safeTitle + '.wav')}`;
             a.download = `${safeTitle}.wav`;
             document.body.appendChild(a);
             a.click();
             document.body.removeChild(a);
-            URL.revokeObjectURL(downloadUrl);
             log('Download started.', 'ok');
 
         } catch (error) {
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import artifacts
+
+@pytest.fixture
+def store(tmp_path):
+    artifacts.init(str(tmp_path))
+    artifacts._state["last_cleanup"] = 0.0
+    return tmp_path
+
+def _wav_bytes(tmp_path, seconds=0.1):
+    path = tmp_path / "src.wav"
+    sf.write(path, np.zeros(int(24000 * seconds), dtype=np.float32), 24000)
+    data = path.read_bytes()
+    path.unlink()
+    return data
+
+def _age(path, seconds):
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+def test_parse_range():
+    assert artifacts.parse_range(None, 100) is None
+    assert artifacts.parse_range("bytes=0-9,20-29", 100) is None
+    assert artifacts.parse_range("bytes=10-19", 100) == (10, 19)
+    assert artifacts.parse_range("bytes=90-", 100) == (90, 99)
+    assert artifacts.parse_range("bytes=-10", 100) == (90, 99)
+    assert artifacts.parse_range("bytes=-500", 100) == (0, 99)
+    assert artifacts.parse_range("bytes=50-500", 100) == (50, 99)
+    for bad in ("bytes=100-", "bytes=20-10", "bytes=a-b", "bytes=-0"):
+        with pytest.raises(ValueError):
+            artifacts.parse_range(bad, 100)
+
+def test_store_get_delete(store):
+    meta = artifacts.store_bytes(_wav_bytes(store), "generated", {"text": "hi"})
+    got = artifacts.get(meta["id"])
+    assert got["text"] == "hi" and got["sample_rate"] == 24000 and os.path.exists(got["path"])
+    assert artifacts.get("../etc/passwd") is None
+    artifacts.delete(meta["id"])
+    assert artifacts.get(meta["id"]) is None
+
+def test_sidecar_rewrite_leaves_no_temp_files(store):
+    meta = artifacts.store_bytes(_wav_bytes(store), "generated")
+    sidecar = store / f"{meta['id']}.json"
+    data = json.loads(sidecar.read_text())
+    data["accessed"] -= artifacts.CLEANUP_INTERVAL + 1
+    sidecar.write_text(json.dumps(data))
+    assert artifacts.get(meta["id"])["accessed"] > data["accessed"]
+    assert sorted(p.suffix for p in store.iterdir()) == [".json", ".wav"]
+
+def test_cleanup_skips_unreadable_fresh_sidecar(store):
+    meta = artifacts.store_bytes(_wav_bytes(store), "generated")
+    (store / f"{meta['id']}.json").write_text("{")
+    artifacts.maybe_cleanup(force=True)
+    assert (store / f"{meta['id']}.wav").exists()
+
+    _age(store / f"{meta['id']}.json", artifacts.ORPHAN_GRACE + 1)
+    artifacts.maybe_cleanup(force=True)
+    assert not (store / f"{meta['id']}.wav").exists()
+
+def test_cleanup_removes_old_orphan_wavs_only(store):
+    fresh = store / ("a" * 32 + ".wav")
+    old = store / ("b" * 32 + ".wav")
+    fresh.write_bytes(b"x" * 10)
+    old.write_bytes(b"x" * 10)
+    _age(old, artifacts.ORPHAN_GRACE + 1)
+    artifacts.maybe_cleanup(force=True)
+    assert fresh.exists() and not old.exists()
+
+def test_cleanup_counts_orphans_against_budget(store, monkeypatch):
+    meta = artifacts.store_bytes(_wav_bytes(store), "generated")
+    (store / ("c" * 32 + ".wav")).write_bytes(b"x" * 1000)
+    monkeypatch.setattr(artifacts, "ARTIFACT_MAX_BYTES", meta["size"] + 500)
+    artifacts.maybe_cleanup(force=True)
+    assert artifacts.get(meta["id"]) is None
@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import audio_encoding
+
+def _tone(frames, channels=1):
+    t = np.arange(frames) / 24000.0
+    x = 0.5 * np.sin(2 * np.pi * 440.0 * t).astype(np.float32)
+    return x if channels == 1 else np.stack([x, -x], axis=1)
+
+@pytest.mark.parametrize("sample_format,subtype,tolerance", [
+    ("pcm16", "PCM_16", 2 / 32767),
+    ("pcm24", "PCM_24", 2 / 8388607),
+    ("float32", "FLOAT", 0.0),
+])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_encode_wav_round_trip(sample_format, subtype, tolerance, channels):
+    x = _tone(70000, channels)  # Longer than CHUNK_SAMPLES, so the chunked path runs more than once
+    buf = audio_encoding.encode_wav(x, 24000, sample_format)
+    assert len(buf) == audio_encoding.HEADER_BYTES + x.size * audio_encoding.FORMATS[sample_format][0]
+
+    info = sf.info(io.BytesIO(bytes(buf)))
+    assert (info.samplerate, info.channels, info.frames, info.subtype) == (24000, channels, 70000, subtype)
+    y, _ = sf.read(io.BytesIO(bytes(buf)), dtype="float32", always_2d=False)
+    assert np.max(np.abs(y - x)) <= tolerance
+
+def test_encode_wav_clips_out_of_range_samples():
+    x = np.array([2.0, -2.0, 0.0], dtype=np.float32)
+    y, _ = sf.read(io.BytesIO(bytes(audio_encoding.encode_wav(x, 24000, "pcm16", dither=False))),
+                   dtype="int16")
+    assert list(y) == [32767, -32768, 0]
+
+def test_encode_wav_empty():
+    buf = audio_encoding.encode_wav(np.zeros(0, dtype=np.float32), 24000)
+    assert len(buf) == audio_encoding.HEADER_BYTES
+    assert sf.info(io.BytesIO(bytes(buf))).frames == 0
+
+def test_resample_length_and_tone():
+    x = _tone(24000)
+    y = audio_encoding.resample(x, 24000, 48000)
+    assert len(y) == 48000
+    # The 440 Hz tone lands on the same frequency at the new rate
+    assert np.argmax(np.abs(np.fft.rfft(y))) == 440
+    assert np.array_equal(audio_encoding.resample(x, 24000, 24000), x)
+    assert audio_encoding.resample(_tone(24000, 2), 24000, 16000).shape == (16000, 2)
@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+import loudness
+
+def _direct(b, a, x):
+    """Reference sample-by-sample biquad."""
+    b = [c / a[0] for c in b]
+    a = [c / a[0] for c in a]
+    y = np.zeros(len(x))
+    x1 = x2 = y1 = y2 = 0.0
+    for i, v in enumerate(x):
+        y[i] = b[0] * v + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        x2, x1, y2, y1 = x1, v, y1, y[i]
+    return y
+
+def test_streamed_biquad_matches_direct_filter():
+    x = np.random.default_rng(0).standard_normal(5000)
+    for b, a in loudness._k_weighting(24000) + [loudness._shelf("high", 2000.0, 7.0, 0.5, 24000)]:
+        stage = loudness._Biquad(b, a, block=512)
+        # Uneven block sizes, including single samples, exercise the carried state
+        pieces, start = [], 0
+        for size in (1, 300, 512, 3, 512, 200):
+            pieces.append(stage.process(x[start:start + size]))
+            start += size
+        while start < len(x):
+            pieces.append(stage.process(x[start:start + 512]))
+            start += 512
+        assert np.allclose(np.concatenate(pieces), _direct(b, a, x), atol=1e-9)
+
+def _sine(freq, seconds, sr, amplitude=1.0):
+    t = np.arange(int(sr * seconds)) / sr
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+def test_sine_calibration():
+    # BS.1770: a 0 dBFS 997 Hz sine reads -3.01 LUFS. Gating blocks that overlap the segment's
+    # edges are counted too (merges pad segments with silence), so check the steady-state bin.
+    stats = loudness.analyze(_sine(997, 5, 48000), 48000)["stats"]["podcast"]
+    steady = max(stats["blocks"], key=lambda b: b[1])[0]
+    assert abs(loudness.ABSOLUTE_GATE + (steady + 0.5) * loudness.BIN_LU + 3.01) < 0.1
+    assert abs(stats["true_peak"]) < 0.1
+
+def test_true_peak_finds_intersample_peak():
+    sr = 24000
+    # Samples straddle the crests, so the sample peak is 3 dB below the true peak
+    x = np.sin(2 * np.pi * (sr / 4) * np.arange(sr) / sr + math.pi / 4)
+    stats = loudness.analyze(x, sr)["stats"]["podcast"]
+    assert 20 * math.log10(np.max(np.abs(x))) < -2.9
+    assert abs(stats["true_peak"]) < 0.3
+
+def test_segment_stats_combine_like_the_whole():
+    sr = 24000
+    quiet, loud = _sine(440, 3, sr, 0.05), _sine(440, 3, sr, 0.5)
+    gap = np.zeros(sr)  # Merges put silence between segments
+    parts = [loudness.analyze(s, sr)["stats"]["podcast"] for s in (quiet, loud)]
+    whole = loudness.analyze(np.concatenate([gap, quiet, gap, loud, gap]), sr)["stats"]["podcast"]
+    assert abs(loudness.integrated_loudness(parts) - loudness.integrated_loudness([whole])) < 0.2
+
+def test_silence_and_plan():
+    silent = loudness.analyze(np.zeros(24000), 24000)["stats"]["podcast"]
+    assert loudness.integrated_loudness([silent]) is None and silent["true_peak"] is None
+    plan = loudness.plan([silent])
+    assert plan["gain_db"] == 0.0 and plan["limit_db"] is None
+
+    loud = loudness.analyze(_sine(997, 3, 24000, 0.9), 24000)["stats"]["podcast"]
+    plan = loudness.plan([loud])
+    assert abs(plan["integrated"] + plan["gain_db"] - loudness.TARGET_LUFS) < 1e-9
+    assert plan["limit_db"] is None  # Turned down, so no limiting needed
+
+def test_peak_limiter_caps_output_and_preserves_length():
+    sr = 24000
+    limiter = loudness.PeakLimiter(-6.0, sr)
+    x = (_sine(200, 1, sr, 1.0) * np.linspace(0.2, 1.0, sr))[:, None].astype(np.float32)
+    out = [limiter.process(x[i:i + 1000]) for i in range(0, len(x), 1000)]
+    tail = limiter.flush()
+    y = np.concatenate(out + [tail])
+    assert y.shape == x.shape
+    assert np.max(np.abs(y)) <= 10 ** (-6 / 20) + 1e-6
+    assert np.allclose(y[:2000], x[:2000], atol=1e-6)  # Quiet start passes untouched
+    assert loudness.PeakLimiter(-1.0, sr).flush() is None
@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("fastapi")
+
+# main reads these at import time: stub model, throwaway data directory
+os.environ["TTS_STUB_MODEL"] = "1"
+os.environ["TTS_DATA_DIR"] = tempfile.mkdtemp(prefix="tts-merge-test-")
+
+from fastapi.testclient import TestClient
+
+import main
+
+@pytest.mark.parametrize("artifact_ids", ["[1,2", "[1, 2]", '["a", null]', "[[]]"])
+def test_merge_rejects_bad_id_lists(artifact_ids):
+    response = TestClient(main.app).post("/api/merge", data={"artifact_ids": artifact_ids})
+    assert response.status_code == 400
+
+def test_parse_id_list_accepts_json_and_commas():
+    assert main.parse_id_list('["a", "b"]') == ["a", "b"]
+    assert main.parse_id_list(" a, b ,,c ") == ["a", "b", "c"]
+    assert main.parse_id_list(None) == []
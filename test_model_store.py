@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import model_store
+
+MODEL = "Qwen/Test-Model"
+
+class _HubHandler(BaseHTTPRequestHandler):
+    """Stand-in for the Hub's revision, tree and resolve endpoints, with Range support."""
+    hub = None
+
+    def do_GET(self):
+        hub = self.hub
+        if self.path == f"/api/models/{MODEL}/revision/main":
+            return self._send(200, json.dumps({"sha": hub["sha"]}).encode())
+        if self.path == f"/api/models/{MODEL}/tree/{hub['sha']}?recursive=true":
+            return self._send(200, json.dumps(hub["tree"]).encode())
+        m = re.fullmatch(rf"/{MODEL}/resolve/([0-9a-f]+)/(.+)", self.path)
+        if not m or m.group(1) != hub["sha"]:
+            return self._send(404, b"")
+        data = hub["served"][m.group(2)]
+        hub["ranges"].append(self.headers.get("Range"))
+        start = int(re.fullmatch(r"bytes=(\d+)-", self.headers["Range"]).group(1)) if self.headers.get("Range") else 0
+        self._send(206 if start else 200, data[start:])
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _tree(files):
+    tree = []
+    for path, data in files.items():
+        blob = hashlib.sha1(f"blob {len(data)}\0".encode() + data).hexdigest()
+        entry = {"type": "file", "path": path, "size": len(data), "oid": blob}
+        if path.endswith(".safetensors"):
+            entry["lfs"] = {"oid": hashlib.sha256(data).hexdigest(), "size": len(data)}
+            entry["oid"] = "0" * 40  # The pointer's blob id, not the content's
+            entry["size"] = 134
+        tree.append(entry)
+    return tree
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    files = {"model.safetensors": os.urandom(3 * 1024 * 1024 + 11), "config.json": b'{"a": 1}'}
+    state = {"sha": "a" * 40, "files": files, "served": dict(files), "tree": _tree(files), "ranges": []}
+    _HubHandler.hub = state
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _HubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(model_store, "HF_ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(model_store, "HF_CACHE_DIR", str(tmp_path / "hf-cache"))
+    model_store.init(str(tmp_path / "models"))
+    yield state
+    server.shutdown()
+
+def _run():
+    job = model_store._new_job(MODEL)
+    model_store._run_job(job, MODEL)
+    return job
+
+def _snapshot():
+    return model_store.snapshot_dir(MODEL)
+
+def test_download_pins_revision_and_verifies(hub):
+    job = _run()
+    assert job["status"] == "complete", job["error"]
+    assert job["revision"] == hub["sha"]
+    for path, data in hub["files"].items():
+        with open(os.path.join(_snapshot(), path), "rb") as f:
+            assert f.read() == data
+    with open(os.path.join(_snapshot(), model_store.MANIFEST)) as f:
+        assert json.load(f)["revision"] == hub["sha"]
+    assert model_store.local_path(MODEL) == _snapshot()
+
+def test_resume_from_part_with_range(hub):
+    data = hub["files"]["model.safetensors"]
+    os.makedirs(_snapshot())
+    with open(os.path.join(_snapshot(), model_store.REVISION_FILE), "w") as f:
+        f.write(hub["sha"])
+    with open(os.path.join(_snapshot(), "model.safetensors.part"), "wb") as f:
+        f.write(data[:1000])
+    job = _run()
+    assert job["status"] == "complete", job["error"]
+    assert "bytes=1000-" in hub["ranges"]
+    with open(os.path.join(_snapshot(), "model.safetensors"), "rb") as f:
+        assert f.read() == data
+
+def test_part_from_another_revision_is_discarded(hub):
+    os.makedirs(_snapshot())
+    with open(os.path.join(_snapshot(), model_store.REVISION_FILE), "w") as f:
+        f.write("b" * 40)
+    with open(os.path.join(_snapshot(), "model.safetensors.part"), "wb") as f:
+        f.write(b"old revision bytes")
+    job = _run()
+    assert job["status"] == "complete", job["error"]
+    assert all(r is None for r in hub["ranges"])
+    with open(os.path.join(_snapshot(), "model.safetensors"), "rb") as f:
+        assert f.read() == hub["files"]["model.safetensors"]
+
+def test_stale_file_of_right_size_is_replaced(hub):
+    os.makedirs(_snapshot())
+    with open(os.path.join(_snapshot(), "config.json"), "wb") as f:
+        f.write(b'{"a": 2}')
+    job = _run()
+    assert job["status"] == "complete", job["error"]
+    with open(os.path.join(_snapshot(), "config.json"), "rb") as f:
+        assert f.read() == b'{"a": 1}'
+
+def test_checksum_mismatch_fails_without_installing(hub):
+    data = hub["files"]["model.safetensors"]
+    hub["served"]["model.safetensors"] = data[:-1] + bytes([data[-1] ^ 1])
+    job = _run()
+    assert job["status"] == "error" and "checksum" in job["error"]
+    assert not os.path.exists(os.path.join(_snapshot(), "model.safetensors"))
+    assert model_store.local_path(MODEL) is None
+
+def _hf_cache_copy(files, sha="c" * 40):
+    """Lay files out the way huggingface_hub caches a download: blobs plus symlinked snapshot."""
+    repo = os.path.join(model_store.HF_CACHE_DIR, "models--" + MODEL.replace("/", "--"))
+    snapshot = os.path.join(repo, "snapshots", sha)
+    os.makedirs(os.path.join(repo, "blobs"))
+    os.makedirs(os.path.join(repo, "refs"))
+    with open(os.path.join(repo, "refs", "main"), "w") as f:
+        f.write(sha)
+    for path, data in files.items():
+        blob = os.path.join(repo, "blobs", hashlib.sha256(data).hexdigest())
+        with open(blob, "wb") as f:
+            f.write(data)
+        link = os.path.join(snapshot, path)
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        os.symlink(os.path.relpath(blob, os.path.dirname(link)), link)
+    return repo, snapshot
+
+def test_hf_cache_copy_counts_as_downloaded(hub):
+    repo, snapshot = _hf_cache_copy(hub["files"])
+    status = model_store.status(MODEL)
+    assert status["downloaded"] and status["location"] == "hf_cache"
+    assert status["disk_bytes"] == sum(len(d) for d in hub["files"].values())
+    # Prefetch finds the cached copy instead of downloading another
+    job = model_store.prefetch(MODEL)
+    assert job["status"] == "complete" and hub["ranges"] == []
+    assert not os.path.exists(_snapshot())
+    assert model_store.delete(MODEL)
+    assert not os.path.exists(repo)
+    assert not model_store.status(MODEL)["downloaded"]
+
+def test_hf_cache_copy_missing_a_shard_is_not_downloaded(hub):
+    index = json.dumps({"weight_map": {"a": "model-00001-of-00002.safetensors",
+                                       "b": "model-00002-of-00002.safetensors"}}).encode()
+    _hf_cache_copy({"config.json": b"{}", "model.safetensors.index.json": index,
+                    "model-00001-of-00002.safetensors": b"weights"})
+    assert model_store.hf_cache_path(MODEL) is None
+    assert model_store.status(MODEL)["location"] is None
+
+def test_delete_without_any_copy(hub):
+    assert model_store.delete(MODEL) is False
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import profiling
+
+@pytest.fixture(autouse=True)
+def traces_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_state", {"dir": None, "keep": 0})
+    monkeypatch.setattr(profiling, "settings", dict(profiling.settings, mode="off", remaining=0, rate=0.0))
+    profiling.init(str(tmp_path), keep=3)
+    return tmp_path
+
+def _traced_request(headers):
+    """What /api/generate does: start, a span, a profiled worker call, finish."""
+    async def request():
+        trace = profiling.start("generate", headers)
+        with profiling.span("model_fetch"):
+            pass
+        result = await profiling.to_thread("inference", sum, [1, 2, 3], profile_call=True)
+        summary = await profiling.finish(trace) if trace else None
+        return result, summary, profiling.span("after") is profiling._NULL
+    return asyncio.run(request())
+
+def test_traced_request_writes_files(traces_dir):
+    result, summary, cleared = _traced_request({"x-profile": "1"})
+    assert result == 6
+    assert cleared  # finish() detaches the trace from the request
+    assert set(summary["spans"]) == {"model_fetch", "queue", "inference"}
+    assert sorted(summary["files"]) == sorted([f"{summary['id']}.trace.json", f"{summary['id']}.pstats"])
+    with open(traces_dir / f"{summary['id']}.trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [e["name"] for e in events] == ["model_fetch", "queue", "inference"]
+    assert [t["id"] for t in profiling.list_traces()] == [summary["id"]]
+    assert "inference;dur=" in profiling.server_timing(summary)
+
+def test_untraced_request_costs_nothing(traces_dir, monkeypatch):
+    calls = []
+    real = asyncio.to_thread
+
+    async def spy(func, *args, **kwargs):
+        calls.append(func)
+        return await real(func, *args, **kwargs)
+
+    monkeypatch.setattr(asyncio, "to_thread", spy)
+    result, summary, _ = _traced_request({})
+    assert (result, summary) == (6, None)
+    assert profiling.start("generate", {"x-profile": "0"}) is None
+    assert profiling.span("anything") is profiling._NULL
+    # The call goes to asyncio.to_thread as is, without a wrapper or cProfile
+    assert calls == [sum]
+    assert os.listdir(traces_dir) == []
+
+def test_next_mode_traces_a_fixed_number(traces_dir):
+    profiling.configure("next", count=2)
+    assert [bool(_traced_request({})[1]) for _ in range(3)] == [True, True, False]
+    assert profiling.settings["mode"] == "off"
+
+def test_only_the_newest_traces_are_kept(traces_dir):
+    ids = []
+    for i in range(5):
+        # Spread the mtimes out so the order does not depend on the filesystem's timestamp resolution
+        ids.append(_traced_request({"x-profile": "1"})[1]["id"])
+        for name in os.listdir(traces_dir):
+            if name.startswith(ids[-1]):
+                os.utime(traces_dir / name, (1000 + i, 1000 + i))
+    assert [t["id"] for t in profiling.list_traces()] == ids[:-4:-1]
+    assert len(os.listdir(traces_dir)) == 6
+
+def test_trace_path_only_serves_trace_files(traces_dir):
+    summary = _traced_request({"x-profile": "1"})[1]
+    assert profiling.trace_path(f"{summary['id']}.pstats") == str(traces_dir / f"{summary['id']}.pstats")
+    assert profiling.trace_path("../main.py") is None
+    assert profiling.trace_path("0" * 32 + ".pstats") is None
@@ -0,0 +1,143 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+import router
+
+def _backend(url, model=None, active=0, healthy=True):
+    router.backends[url].update(healthy=healthy, model=model, active=active)
+
+@pytest.fixture
+def three():
+    urls = ["http://a", "http://b", "http://c"]
+    router.configure(urls, max_active=1, spill_queue=3)
+    for url in urls:
+        _backend(url)
+    yield urls
+    router.configure([])
+
+MODEL = "Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice"
+
+def test_ring_candidates_cover_every_node_once():
+    ring = router.HashRing(["x", "y", "z"])
+    for key in ("a", "b", MODEL):
+        assert sorted(ring.candidates(key)) == ["x", "y", "z"]
+    assert router.HashRing([]).candidates("a") == []
+
+def test_ring_removal_only_moves_removed_nodes_keys():
+    full = router.HashRing(["x", "y", "z"])
+    less = router.HashRing(["x", "y"])
+    for i in range(200):
+        key = f"key{i}"
+        if full.candidates(key)[0] != "z":
+            assert less.candidates(key)[0] == full.candidates(key)[0]
+
+def test_idle_owner_first(three):
+    owner = router.ring.candidates(MODEL)[0]
+    assert router.pick_backends(MODEL)[0] == owner
+
+def test_busy_owner_with_model_beats_idle_backend_that_must_swap(three):
+    owner = router.ring.candidates(MODEL)[0]
+    for url in three:
+        _backend(url, model="other")
+    _backend(owner, model=MODEL, active=1)
+    assert router.pick_backends(MODEL)[0] == owner
+
+def test_backend_already_holding_model_counts_as_home(three):
+    owner, second, third = router.ring.candidates(MODEL)
+    _backend(owner, model="other", active=2)
+    _backend(third, model=MODEL)
+    _backend(second, model="other")
+    assert router.pick_backends(MODEL)[0] == third
+
+def test_spills_once_owner_queue_reaches_threshold(three):
+    owner = router.ring.candidates(MODEL)[0]
+    _backend(owner, model=MODEL, active=2)
+    assert router.pick_backends(MODEL)[0] == owner
+    _backend(owner, model=MODEL, active=3)  # Two waiting plus the next one: queue of 3
+    picked = router.pick_backends(MODEL)
+    assert picked[0] != owner and owner in picked
+
+def test_unhealthy_backends_last(three):
+    owner = router.ring.candidates(MODEL)[0]
+    _backend(owner, healthy=False)
+    picked = router.pick_backends(MODEL)
+    assert picked[-1] == owner and len(picked) == 3
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while (size := int(self.rfile.readline(), 16)):
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        reply = f"{len(body)} {self.headers.get('Content-Length')}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def echo_backend():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    router.configure([url])
+    _backend(url)
+    yield url
+    server.shutdown()
+    router.configure([])
+
+def test_other_paths_stream_body_through(echo_backend):
+    payload = b"x" * (3 * 1024 * 1024 + 7)
+    with TestClient(router.app) as client:
+        r = client.post("/api/merge", content=payload)
+        assert r.status_code == 200
+        assert r.text == f"{len(payload)} {len(payload)}"
+        assert r.headers["X-Backend"] == echo_backend
+
+        chunked = client.post("/api/merge", content=iter([b"ab", b"", b"cde"]))
+        assert chunked.text == "5 None"
+        # The backend's Content-Length is relayed, not turned into a chunked reply
+        assert r.headers["content-length"] == str(len(r.content))
+        assert "transfer-encoding" not in r.headers
+
+@pytest.fixture
+def session_backend():
+    from websockets.sync.server import serve
+
+    seen = []
+
+    def handler(ws):
+        seen.append(ws.request.path)
+        for message in ws:
+            ws.send(message)  # Echo text as text, bytes as bytes
+
+    server = serve(handler, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.socket.getsockname()[1]}"
+    router.configure(["http://127.0.0.1:9", url])  # The first one refuses connections
+    _backend("http://127.0.0.1:9")
+    _backend(url)
+    yield url, seen
+    server.shutdown()
+    router.configure([])
+
+def test_session_websocket_is_relayed(session_backend):
+    url, seen = session_backend
+    with TestClient(router.app) as client:
+        with client.websocket_connect("/api/session") as ws:
+            ws.send_text('{"type": "configure", "model_type": "CustomVoice"}')
+            assert ws.receive_text() == '{"type": "configure", "model_type": "CustomVoice"}'
+            ws.send_bytes(b"\x00\x01")
+            assert ws.receive_bytes() == b"\x00\x01"
+    assert seen == ["/api/session"]
+    assert not router.backends["http://127.0.0.1:9"]["healthy"]
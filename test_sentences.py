@@ -0,0 +1,40 @@
+import numpy as np
+
+import sentences
+
+def test_split_sentences():
+    assert sentences.split_sentences("It costs 3.5 dollars today. Then it rose again!") == \
+        ["It costs 3.5 dollars today.", "Then it rose again!"]
+    # Short fragments join the next sentence
+    assert sentences.split_sentences("Dr. Smith arrived late again.") == ["Dr. Smith arrived late again."]
+    assert sentences.split_sentences("你好。再见！") == ["你好。", "再见！"]
+    assert sentences.split_sentences("   ") == [""]
+
+def test_plan_reuses_unchanged_sentences():
+    old = ["A one.", "B two.", "C three."]
+    assert sentences.plan(old, old) == [0, 1, 2]
+    assert sentences.plan(old, ["A one.", "B changed.", "C three."]) == [0, None, 2]
+    assert sentences.plan(old, ["New.", "A one.", "C three."]) == [None, 0, 2]
+    assert sentences.plan([], ["A one."]) == [None]
+
+def test_splice_crossfades_boundaries():
+    sr = 1000
+    a = np.ones(100, dtype=np.float32)
+    b = np.full(100, 3.0, dtype=np.float32)
+    out = sentences.splice([a, b], sr, crossfade=0.01)
+    assert len(out) == 190
+    assert np.all(out[:90] == 1.0) and np.all(out[100:] == 3.0)
+    assert np.all(np.diff(out[90:100]) > 0)  # Ramps from one segment into the next
+
+def test_splice_edge_cases():
+    assert len(sentences.splice([], 1000)) == 0
+    one = np.arange(5, dtype=np.float32)
+    assert np.array_equal(sentences.splice([one, np.zeros(0)], 1000), one)
+    # A segment shorter than the crossfade overlaps by its own length only
+    assert len(sentences.splice([np.ones(100), np.ones(3)], 1000, crossfade=0.01)) == 100
+
+def test_cache_is_per_voice():
+    seg = [np.zeros(10, dtype=np.float32)]
+    sentences.remember("para", "voice-a", ["Hello there."], seg, 24000)
+    assert sentences.lookup("para", "voice-a")["sentences"] == ["Hello there."]
+    assert sentences.lookup("para", "voice-b") is None
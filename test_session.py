@@ -0,0 +1,155 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("fastapi")
+
+# main reads these at import time: stub model, throwaway data directory
+os.environ["TTS_STUB_MODEL"] = "1"
+os.environ["TTS_DATA_DIR"] = tempfile.mkdtemp(prefix="tts-session-test-")
+
+from fastapi.testclient import TestClient
+
+import main
+
+class FakeSynth:
+    """Replaces synthesize_paragraph_sync: records calls and can hold them until released."""
+
+    def __init__(self, block=False):
+        self.texts = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, tts_model, model_type, text, language, paragraph_id, fingerprint, fresh=False, **voice):
+        self.texts.append(text)
+        self.started.set()
+        assert self.release.wait(10)
+        # Audio length tracks the text, so a result can be matched to the text it came from
+        return np.zeros(len(text) * 240, dtype=np.float32), 24000, 0, 1
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+def _configure(ws):
+    ws.send_json({"type": "configure", "model_type": "CustomVoice", "artifacts_only": True})
+    assert ws.receive_json()["type"] == "configured"
+
+def _receive_until(ws, kind):
+    while True:
+        msg = ws.receive_json()
+        if msg["type"] in (kind, "error"):
+            return msg
+
+def test_bad_messages_keep_the_session_open(client):
+    with client.websocket_connect("/api/session") as ws:
+        ws.send_text("[1, 2")
+        assert ws.receive_json()["detail"].startswith("Invalid JSON")
+        ws.send_text("[1, 2]")
+        assert ws.receive_json()["detail"] == "Messages must be JSON objects"
+        ws.send_json({"type": "rename"})
+        assert ws.receive_json()["detail"] == "Unknown message type: rename"
+        ws.send_json({"type": "upsert", "text": "No id"})
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "configure", "sample_rate": "fast"})
+        assert ws.receive_json()["detail"] == "sample_rate must be an integer."
+        ws.send_json({"type": "configure", "model_type": "Base", "profile_id": "missing"})
+        assert ws.receive_json()["detail"] == "Profile not found"
+        _configure(ws)
+
+def test_rapid_edits_are_coalesced(client, monkeypatch):
+    synth = FakeSynth()
+    monkeypatch.setattr(main, "synthesize_paragraph_sync", synth)
+    with client.websocket_connect("/api/session") as ws:
+        _configure(ws)
+        for text in ("First draft.", "Second draft.", "Final text."):
+            ws.send_json({"type": "upsert", "paragraph_id": "p", "text": text})
+        audio = _receive_until(ws, "audio")
+        assert audio["type"] == "audio"
+    assert synth.texts == ["Final text."]
+
+def test_result_for_edited_text_is_dropped(client, monkeypatch):
+    synth = FakeSynth(block=True)
+    monkeypatch.setattr(main, "synthesize_paragraph_sync", synth)
+    with client.websocket_connect("/api/session") as ws:
+        _configure(ws)
+        ws.send_json({"type": "upsert", "paragraph_id": "p", "text": "Old text."})
+        assert synth.started.wait(10)
+        ws.send_json({"type": "upsert", "paragraph_id": "p", "text": "The new, longer text."})
+        queued = _receive_until(ws, "status")
+        while queued["state"] != "queued" or queued["version"] == 1:
+            queued = _receive_until(ws, "status")
+        synth.release.set()
+        audio = _receive_until(ws, "audio")
+        assert audio["version"] == queued["version"]
+        assert audio["artifact"]["duration"] == pytest.approx(len("The new, longer text.") / 100)
+    assert synth.texts == ["Old text.", "The new, longer text."]
+
+def test_recreated_paragraph_does_not_get_old_audio(client, monkeypatch):
+    # The UI deletes para-N on every re-parse and then upserts the same ids with new text
+    synth = FakeSynth(block=True)
+    monkeypatch.setattr(main, "synthesize_paragraph_sync", synth)
+    with client.websocket_connect("/api/session") as ws:
+        _configure(ws)
+        ws.send_json({"type": "upsert", "paragraph_id": "para-0", "text": "Old text."})
+        first = _receive_until(ws, "status")
+        assert synth.started.wait(10)
+        ws.send_json({"type": "delete", "paragraph_id": "para-0"})
+        ws.send_json({"type": "upsert", "paragraph_id": "para-0", "text": "Replacement paragraph."})
+        synth.release.set()
+        audio = _receive_until(ws, "audio")
+        assert audio["version"] > first["version"]
+        assert audio["artifact"]["duration"] == pytest.approx(len("Replacement paragraph.") / 100)
+
+def test_deleted_paragraph_is_not_generated(client, monkeypatch):
+    synth = FakeSynth()
+    monkeypatch.setattr(main, "synthesize_paragraph_sync", synth)
+    with client.websocket_connect("/api/session") as ws:
+        _configure(ws)
+        ws.send_json({"type": "upsert", "paragraph_id": "gone", "text": "Never mind."})
+        ws.send_json({"type": "delete", "paragraph_id": "gone"})
+        ws.send_json({"type": "upsert", "paragraph_id": "kept", "text": "Keep this."})
+        audio = _receive_until(ws, "audio")
+        assert audio["paragraph_id"] == "kept"
+    assert synth.texts == ["Keep this."]
+
+def test_paragraphs_generate_concurrently(client, monkeypatch):
+    # Each call waits for the other two, so this only finishes if all three run at once
+    barrier = threading.Barrier(3, timeout=10)
+
+    def synth(tts_model, model_type, text, language, paragraph_id, fingerprint, fresh=False, **voice):
+        barrier.wait()
+        return np.zeros(2400, dtype=np.float32), 24000, 0, 1
+
+    monkeypatch.setattr(main, "synthesize_paragraph_sync", synth)
+    monkeypatch.setattr(main, "SESSION_CONCURRENCY", 3)
+    with client.websocket_connect("/api/session") as ws:
+        _configure(ws)
+        for i in range(3):
+            ws.send_json({"type": "upsert", "paragraph_id": f"para-{i}", "text": f"Paragraph {i}."})
+        done = {_receive_until(ws, "audio")["paragraph_id"] for _ in range(3)}
+    assert done == {"para-0", "para-1", "para-2"}
+
+def test_session_pins_its_model(client, monkeypatch):
+    monkeypatch.setattr(main, "MODEL_LOAD_WAIT", 0.1)
+    model_id = "Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice"
+    with client.websocket_connect("/api/session") as ws:
+        _configure(ws)
+        assert main.model_pins == {model_id: 1}
+        # Another model cannot swap the pinned one out
+        response = client.post("/api/generate", data={"text": "Hi.", "model_type": "VoiceDesign",
+                                                      "voice_design_prompt": "A calm voice"})
+        assert response.status_code == 503
+        assert main.current_model_id == model_id
+        # Reconfiguring moves the session's own pin
+        ws.send_json({"type": "configure", "model_type": "VoiceDesign", "voice_design_prompt": "A calm voice"})
+        assert ws.receive_json()["type"] == "configured"
+        assert main.model_pins == {"Qwen/Qwen3-TTS-12Hz-1.7B-VoiceDesign": 1}
+    assert main.model_pins == {}
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import updater
+
+class _ReleaseHandler(BaseHTTPRequestHandler):
+    """Stand-in for the releases API (with ETags) and a file host."""
+    state = None
+
+    def do_GET(self):
+        state = self.state
+        state["requests"].append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/latest":
+            if self.headers.get("If-None-Match") == state["etag"]:
+                return self._send(304, b"")
+            return self._send(200, json.dumps(state["release"]).encode(), {"ETag": state["etag"]})
+        data = state["files"].get(self.path.lstrip("/"))
+        if data is None:
+            return self._send(404, b"")
+        self._send(200, data)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    state = {"release": {"tag_name": "v1.2.0"}, "etag": '"v1"', "files": {}, "requests": []}
+    _ReleaseHandler.state = state
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ReleaseHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{httpd.server_port}"
+    yield state
+    httpd.shutdown()
+
+def test_version_tuple():
+    assert updater.version_tuple("v1.2.10") == (1, 2, 10)
+    assert updater.version_tuple("1.2.10") > updater.version_tuple("1.2.9")
+    assert updater.version_tuple("1.3.0-beta") == (1, 3, 0)
+    assert updater.version_tuple("1.10") > updater.version_tuple("1.9.9")
+
+def test_release_cached_within_ttl(server, tmp_path):
+    cache = str(tmp_path / "check.json")
+    url = server["url"] + "/latest"
+    assert updater.fetch_latest_release(url, cache, ttl=3600)["tag_name"] == "v1.2.0"
+    server["release"] = {"tag_name": "v9"}
+    assert updater.fetch_latest_release(url, cache, ttl=3600)["tag_name"] == "v1.2.0"
+    assert len(server["requests"]) == 1
+
+def test_release_revalidated_with_etag_after_ttl(server, tmp_path):
+    cache = str(tmp_path / "check.json")
+    url = server["url"] + "/latest"
+    updater.fetch_latest_release(url, cache, ttl=0)
+    assert updater.fetch_latest_release(url, cache, ttl=0)["tag_name"] == "v1.2.0"
+    assert server["requests"][-1] == ("/latest", '"v1"')
+
+    server["release"], server["etag"] = {"tag_name": "v1.3.0"}, '"v2"'
+    assert updater.fetch_latest_release(url, cache, ttl=3600, force=True)["tag_name"] == "v1.3.0"
+
+def test_stale_release_served_when_offline(server, tmp_path):
+    cache = str(tmp_path / "check.json")
+    url = server["url"] + "/latest"
+    updater.fetch_latest_release(url, cache)
+    with open(cache) as f:
+        cached = json.load(f)
+    cached["url"] = "http://127.0.0.1:9/latest"  # Nothing listens on the discard port
+    with open(cache, "w") as f:
+        json.dump(cached, f)
+    assert updater.fetch_latest_release(cached["url"], cache, ttl=0)["tag_name"] == "v1.2.0"
+
+def _entry(data):
+    return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+
+def test_plan_delta(tmp_path):
+    app = tmp_path / "App.app"
+    (app / "Contents").mkdir(parents=True)
+    (app / "Contents" / "same").write_bytes(b"same")
+    (app / "Contents" / "edited").write_bytes(b"old")
+    (app / "Contents" / "gone").write_bytes(b"gone")
+    manifest = {"files": {
+        "Contents/same": _entry(b"same"),
+        "Contents/edited": _entry(b"new"),
+        "Contents/added": _entry(b"added"),
+    }}
+    changed, removed = updater.plan_delta(manifest, str(app))
+    assert sorted(changed) == ["Contents/added", "Contents/edited"]
+    assert removed == ["Contents/gone"]
+
+    with pytest.raises(ValueError):
+        updater.plan_delta({"files": {"../escape": _entry(b"x")}}, str(app))
+
+def test_stage_delta_verifies_downloads(server, tmp_path):
+    server["files"] = {"files/Contents/a": b"payload"}
+    manifest = {"base_url": server["url"] + "/files/",
+                "files": {"Contents/a": {**_entry(b"payload"), "mode": 0o755}}}
+    staging = tmp_path / "staging"
+    assert updater.stage_delta(manifest, ["Contents/a"], str(staging)) == len(b"payload")
+    assert (staging / "Contents" / "a").read_bytes() == b"payload"
+    assert os.stat(staging / "Contents" / "a").st_mode & 0o777 == 0o755
+
+    server["files"]["files/Contents/a"] = b"tampered"
+    with pytest.raises(ValueError):
+        updater.stage_delta(manifest, ["Contents/a"], str(tmp_path / "again"))
+    assert not (tmp_path / "again" / "Contents" / "a").exists()
@@ -0,0 +1,106 @@
+import asyncio
+import io
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("multipart")
+
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.testclient import TestClient
+
+import uploads
+
+LIMIT = 64 * 1024
+
+@pytest.fixture
+def saved(tmp_path):
+    return tmp_path / "upload.bin"
+
+@pytest.fixture
+def client(saved):
+    app = FastAPI()
+    app.add_middleware(uploads.UploadLimitMiddleware, limits={"/form": LIMIT, "/raw": LIMIT, "/guarded": LIMIT})
+
+    @app.post("/form")
+    async def form(file: UploadFile = File(...)):
+        return {"bytes": await uploads.save_upload(file, str(saved))}
+
+    @app.post("/raw")
+    async def raw(request: Request):
+        return {"bytes": sum([len(chunk) async for chunk in request.stream()])}
+
+    @app.post("/guarded")
+    async def guarded(request: Request):
+        # A handler that turns any read error into its own reply must not hide the 413
+        try:
+            body = await request.body()
+        except Exception:
+            raise HTTPException(status_code=400, detail="Could not read the upload")
+        return {"bytes": len(body)}
+
+    @app.post("/unlimited")
+    async def unlimited(request: Request):
+        return {"bytes": len(await request.body())}
+
+    return TestClient(app)
+
+def _multipart(size):
+    boundary = "test-boundary"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.wav\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + b"\0" * size + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+def _chunked(body, size=16 * 1024):
+    # A generator body is sent with Transfer-Encoding: chunked and no Content-Length
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+def test_declared_length_over_limit_is_rejected_before_reading(client, saved):
+    body, headers = _multipart(LIMIT)
+    response = client.post("/form", content=body, headers=headers)
+    assert response.status_code == 413
+    assert response.json()["detail"] == uploads._too_large(LIMIT)
+    assert not saved.exists()
+
+@pytest.mark.parametrize("path", ["/form", "/raw", "/guarded"])
+def test_chunked_body_over_limit_is_413(client, saved, path):
+    body, headers = _multipart(2 * LIMIT)
+    response = client.post(path, content=_chunked(body), headers=headers)
+    assert response.status_code == 413
+    assert response.json()["detail"] == uploads._too_large(LIMIT)
+    assert not saved.exists()
+
+def test_bodies_under_the_limit_pass(client, saved):
+    body, headers = _multipart(1000)
+    assert client.post("/form", content=_chunked(body), headers=headers).json() == {"bytes": 1000}
+    assert saved.stat().st_size == 1000
+    assert client.post("/raw", content=_chunked(b"x" * LIMIT)).json() == {"bytes": LIMIT}
+    # Paths without a limit are not counted at all
+    assert client.post("/unlimited", content=b"x" * (2 * LIMIT)).json() == {"bytes": 2 * LIMIT}
+
+class _Upload:
+    """The read() side of an UploadFile, optionally failing after the first chunk."""
+
+    def __init__(self, data, fail=False):
+        self.file = io.BytesIO(data)
+        self.fail = fail
+
+    async def read(self, size):
+        if self.fail and self.file.tell():
+            raise OSError("connection reset")
+        return self.file.read(size)
+
+def test_save_upload_removes_partial_file(saved):
+    data = b"\1" * (3 * uploads.CHUNK_SIZE)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(uploads.save_upload(_Upload(data), str(saved), max_bytes=2 * uploads.CHUNK_SIZE))
+    assert excinfo.value.status_code == 413
+    assert not saved.exists()
+
+    with pytest.raises(OSError):
+        asyncio.run(uploads.save_upload(_Upload(data, fail=True), str(saved)))
+    assert not saved.exists()
+
+    assert asyncio.run(uploads.save_upload(_Upload(data), str(saved))) == len(data)
+    assert saved.read_bytes() == data
@@ -0,0 +1,167 @@
+"""
+OTA update helpers: cached release checks and delta downloads.
+
+Release metadata is cached on disk for UPDATE_CHECK_TTL seconds and revalidated with
+If-None-Match afterwards, so page loads do not each cost a GitHub API call (or rate-limit hit).
+
+A release can ship a "manifest.json" asset describing the .app bundle:
+
+    {
+      "version": "1.0.3",
+      "base_url": "https://example.com/releases/1.0.3/files/",
+      "files": {"Contents/MacOS/LocalTTSStudio": {"sha256": "...", "size": 123, "mode": 493}, ...},
+      "zip": {"sha256": "..."}
+    }
+
+With a manifest, only files whose hash differs from the installed bundle are downloaded (from
+base_url + path) and verified; files no longer listed are removed. Without one, the full zip is
+downloaded and checked against the manifest's or GitHub's sha256 digest when available.
+
+TTS_UPDATE_API overrides the releases URL, e.g. to point at a local stand-in server.
+"""
+import hashlib
+import json
+import os
+import time
+import zipfile
+from urllib.parse import quote
+
+import requests
+
+import hashing
+
+UPDATE_CHECK_TTL = float(os.environ.get("TTS_UPDATE_CHECK_TTL", 6 * 3600))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MANIFEST_ASSET = "manifest.json"
+
+def releases_url(repo: str) -> str:
+    return os.environ.get("TTS_UPDATE_API") or f"https://api.github.com/repos/{repo}/releases/latest"
+
+def version_tuple(version: str):
+    parts = []
+    for piece in version.lstrip("v").split("."):
+        digits = "".join(ch for ch in piece if ch.isdigit())
+        parts.append(int(digits) if digits else 0)
+    return tuple(parts)
+
+def _read_cache(cache_path: str):
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(cache_path: str, cache):
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, cache_path)
+
+def fetch_latest_release(url: str, cache_path: str, ttl: float = UPDATE_CHECK_TTL, force: bool = False):
+    """Latest release JSON, from cache while fresh and revalidated with its ETag afterwards.
+
+    On a network error a stale cached copy is returned if there is one.
+    """
+    cache = _read_cache(cache_path)
+    if cache and cache.get("url") == url and not force and time.time() - cache["fetched_at"] < ttl:
+        return cache["data"]
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if cache and cache.get("url") == url and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    try:
+        r = requests.get(url, headers=headers, timeout=10)
+        if r.status_code == 304 and cache:
+            cache["fetched_at"] = time.time()
+            _write_cache(cache_path, cache)
+            return cache["data"]
+        r.raise_for_status()
+    except requests.RequestException:
+        if cache and cache.get("url") == url:
+            return cache["data"]
+        raise
+
+    data = r.json()
+    _write_cache(cache_path, {"url": url, "etag": r.headers.get("ETag"), "fetched_at": time.time(), "data": data})
+    return data
+
+def find_asset(release, predicate):
+    for asset in release.get("assets", []):
+        if predicate(asset["name"]):
+            return asset
+    return None
+
+def asset_sha256(asset):
+    """GitHub reports "digest": "sha256:<hex>" on release assets."""
+    digest = (asset or {}).get("digest") or ""
+    return digest.split(":", 1)[1] if digest.startswith("sha256:") else None
+
+def download(url: str, dest: str, sha256: str = None):
+    """Stream url to dest in DOWNLOAD_CHUNK_SIZE pieces, hashing as it goes."""
+    h = hashlib.sha256()
+    with requests.get(url, stream=True, timeout=(10, 60)) as r:
+        r.raise_for_status()
+        with open(dest, "wb") as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                h.update(chunk)
+    if sha256 and h.hexdigest() != sha256.lower():
+        os.remove(dest)
+        raise ValueError(f"Checksum mismatch for {url}")
+    return h.hexdigest()
+
+def fetch_manifest(url: str):
+    r = requests.get(url, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+def _safe_rel_path(rel_path: str) -> bool:
+    norm = os.path.normpath(rel_path)
+    return not (os.path.isabs(norm) or norm.startswith(".."))
+
+def plan_delta(manifest, app_path: str):
+    """(changed, removed): manifest paths that differ from the installed bundle, and installed
+    files the new release no longer contains."""
+    files = manifest["files"]
+    changed = []
+    for rel_path, entry in files.items():
+        if not _safe_rel_path(rel_path):
+            raise ValueError(f"Unsafe path in manifest: {rel_path}")
+        local = os.path.join(app_path, rel_path)
+        if (not os.path.isfile(local) or os.path.getsize(local) != entry["size"]
+                or hashing.sha256_file(local) != entry["sha256"]):
+            changed.append(rel_path)
+
+    removed = []
+    for root, _, names in os.walk(app_path):
+        for name in names:
+            rel_path = os.path.relpath(os.path.join(root, name), app_path)
+            if rel_path not in files:
+                removed.append(rel_path)
+    return changed, removed
+
+def stage_delta(manifest, changed, staging_dir: str):
+    """Download and verify every changed file into staging_dir, mirroring bundle paths."""
+    base_url = manifest["base_url"].rstrip("/") + "/"
+    total = 0
+    for rel_path in changed:
+        entry = manifest["files"][rel_path]
+        dest = os.path.join(staging_dir, rel_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        download(base_url + quote(rel_path), dest, entry["sha256"])
+        if "mode" in entry:
+            os.chmod(dest, entry["mode"])
+        total += entry["size"]
+    return total
+
+def download_full(download_url: str, temp_dir: str, sha256: str = None):
+    """Download and extract the release zip; returns the extracted .app path."""
+    zip_path = os.path.join(temp_dir, "update.zip")
+    download(download_url, zip_path, sha256)
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        zip_ref.extractall(temp_dir)
+    os.remove(zip_path)
+    for item in os.listdir(temp_dir):
+        if item.endswith(".app"):
+            return os.path.join(temp_dir, item)
+    raise Exception("No .app bundle found in the downloaded zip.")
@@ -0,0 +1,146 @@
+"""
+Bounded upload handling.
+
+Starlette already spools each multipart file part to a temporary file once it passes 1MB, so
+uploads never have to live in memory. These helpers keep it that way: bodies are capped per
+endpoint before and while they are received, uploads are copied to disk in fixed-size
+chunks instead of `await file.read()`, and decoders get a path or the spooled file object.
+"""
+import os
+
+import soundfile as sf
+from fastapi import HTTPException
+
+CHUNK_SIZE = 1024 * 1024
+
+def _mb_env(name: str, default_mb: int) -> int:
+    return int(float(os.environ.get(name, default_mb)) * 1024 * 1024)
+
+# Maximum request body size per endpoint path, in bytes
+UPLOAD_LIMITS = {
+    "/api/profiles": _mb_env("TTS_MAX_REF_UPLOAD_MB", 50),
+    "/api/generate": _mb_env("TTS_MAX_REF_UPLOAD_MB", 50),
+    "/api/merge": _mb_env("TTS_MAX_EXPORT_UPLOAD_MB", 2048),
+    "/api/treat": _mb_env("TTS_MAX_EXPORT_UPLOAD_MB", 2048),
+}
+
+# Maximum audio duration per kind of upload, in seconds
+REF_AUDIO_MAX_SECONDS = float(os.environ.get("TTS_MAX_REF_AUDIO_SECONDS", 120))
+EXPORT_MAX_SECONDS = float(os.environ.get("TTS_MAX_EXPORT_SECONDS", 6 * 3600))
+
+class UploadLimitMiddleware:
+    """Reject request bodies over the endpoint's limit with 413.
+
+    A declared Content-Length is checked before any of the body is read; chunked bodies are
+    counted as they arrive and cut off as soon as they pass the limit.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+        limit = self.limits.get(scope["path"].rstrip("/"))
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    return await _send_413(send, limit)
+
+        received = 0
+        too_large = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if too_large and not started:
+                return  # The app's reply to the cut-off body; the 413 below goes out instead
+            started = True
+            await send(message)
+
+        # However the app surfaces the cut-off body (FastAPI turns errors while parsing a form
+        # into a 400, a handler reading the stream itself may raise), the client gets a 413
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not too_large or started:
+                raise
+        if too_large and not started:
+            await _send_413(send, limit)
+
+class _BodyTooLarge(Exception):
+    pass
+
+def _too_large(limit: int) -> str:
+    return f"Upload too large. Limit is {limit // (1024 * 1024)}MB."
+
+async def _send_413(send, limit: int):
+    body = ('{"detail": "%s"}' % _too_large(limit)).encode()
+    await send({"type": "http.response.start", "status": 413,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def save_upload(upload, dest_path: str, max_bytes: int = None):
+    """Copy an UploadFile to `dest_path` in CHUNK_SIZE pieces; 413 (and no file) past max_bytes."""
+    written = 0
+    try:
+        with open(dest_path, "wb") as f:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_bytes is not None and written > max_bytes:
+                    raise HTTPException(status_code=413, detail=_too_large(max_bytes))
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return written
+
+def rewind(upload):
+    """Spooled file object of an upload, positioned at the start, for decoders that take file-likes."""
+    upload.file.seek(0)
+    return upload.file
+
+def audio_info(source, max_seconds: float = None, label: str = "audio", strict: bool = True):
+    """soundfile info for a path or file-like; 413 if it is too long.
+
+    Undecodable input is a 400 when `strict`; otherwise None is returned so formats that
+    libsndfile cannot read (e.g. m4a reference clips) are left to the model's own loader.
+    """
+    try:
+        info = sf.info(source)
+    except Exception as e:
+        if not strict:
+            return None
+        raise HTTPException(status_code=400, detail=f"Could not read {label}: {e}")
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+    if max_seconds is not None and info.duration > max_seconds:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{label} is {info.duration:.0f}s long; the limit is {max_seconds:.0f}s.",
+        )
+    return info